@@ -25,5 +25,10 @@ app.logger.handlers = gunicorn_logger.handlers
 app.logger.setLevel(gunicorn_logger.level)
 
 # Tell our application about its components
+import finance.encoding
 import finance.model
+import finance.cache
+import finance.passwords
+import finance.ledger
+import finance.metrics
 import finance.routes
\ No newline at end of file
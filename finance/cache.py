@@ -0,0 +1,101 @@
+"""Finance result cache."""
+
+import collections
+import finance
+import threading
+import time
+
+# Each worker process keeps its own cache of recently computed results
+_entries = collections.OrderedDict()
+_entries_lock = threading.Lock()
+
+def version(db, owner):
+    """
+    Get the version of a user's ledger. The version changes whenever the
+    user's transactions or accounts do, so results computed from the ledger can
+    be cached under it.
+
+    Parameters:
+    - db: database connection
+    - owner: user identifier
+
+    Returns:
+    - Version number, or None if the user does not exist
+    """
+
+    user = finance.model.query(db, 'version', [
+        owner
+    ]).fetchone()
+
+    return user['version'] if user else None
+
+def bump(db, owner):
+    """
+    Mark a user's ledger as changed, which invalidates every cached result
+    computed from it once the current transaction commits.
+
+    Parameters:
+    - db: database connection
+    - owner: user identifier
+
+    Returns:
+    - None
+    """
+
+    db.execute("UPDATE users SET version = version + 1 WHERE id = %s;", [
+        owner
+    ])
+
+def get(key):
+    """
+    Look up a cached result.
+
+    Parameters:
+    - key: hashable cache key
+
+    Returns:
+    - Cached result, or None if there isn't one
+    """
+
+    with _entries_lock:
+
+        if key in _entries:
+
+            value, expires = _entries[key]
+
+            # Forget results that are too old
+            if expires is not None and expires <= time.monotonic():
+
+                del _entries[key]
+
+                return None
+
+            # Keep recently used results around the longest
+            _entries.move_to_end(key)
+
+            return value
+
+    return None
+
+def put(key, value, ttl = None):
+    """
+    Cache a result, evicting the least recently used results if the cache is
+    full.
+
+    Parameters:
+    - key: hashable cache key
+    - value: result to cache
+    - ttl: seconds to keep the result, or None to keep it until it's evicted
+
+    Returns:
+    - None
+    """
+
+    with _entries_lock:
+
+        _entries[key] = (value, time.monotonic() + ttl if ttl is not None else None)
+        _entries.move_to_end(key)
+
+        while len(_entries) > finance.app.config['CACHE_SIZE']:
+
+            _entries.popitem(last=False)
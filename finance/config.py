@@ -13,4 +13,60 @@ DB_HOST = os.environ['DB_HOST']
 DB_NAME = os.environ['DB_NAME']
 DB_PORT = os.environ['DB_PORT']
 DB_USER = os.environ['DB_USER']
-DB_PASSWORD = os.environ['DB_PASSWORD']
\ No newline at end of file
+DB_PASSWORD = os.environ['DB_PASSWORD']
+
+# Optional read replica (on the same port and with the same credentials as the
+# primary unless told otherwise), which serves GET and HEAD requests
+DB_REPLICA_HOST = os.environ.get('DB_REPLICA_HOST')
+DB_REPLICA_PORT = os.environ.get('DB_REPLICA_PORT', DB_PORT)
+
+# Seconds after a user changes something that their reads keep going to the
+# primary, so they see their own changes even if the replica is behind
+REPLICA_STICKY_SECONDS = float(os.environ.get('REPLICA_STICKY_SECONDS', 5))
+
+# Database connection pool, sized per worker process
+DB_POOL_MIN_SIZE = int(os.environ.get('DB_POOL_MIN_SIZE', 1))
+DB_POOL_MAX_SIZE = int(os.environ.get('DB_POOL_MAX_SIZE', 4))
+DB_POOL_TIMEOUT = float(os.environ.get('DB_POOL_TIMEOUT', 30))
+DB_POOL_MAX_LIFETIME = float(os.environ.get('DB_POOL_MAX_LIFETIME', 3600))
+DB_POOL_MAX_IDLE = float(os.environ.get('DB_POOL_MAX_IDLE', 600))
+
+# Most transactions accepted by a single batch request
+TRANSACTION_BATCH_LIMIT = int(os.environ.get('TRANSACTION_BATCH_LIMIT', 10000))
+
+# Most accounts or transactions that can be looked up by ID in one request
+MULTI_GET_LIMIT = int(os.environ.get('MULTI_GET_LIMIT', 100))
+
+# Most API calls accepted by a single batch request
+BATCH_REQUEST_LIMIT = int(os.environ.get('BATCH_REQUEST_LIMIT', 20))
+
+# Times to retry a balance change that lost a race with a concurrent one
+LEDGER_RETRIES = int(os.environ.get('LEDGER_RETRIES', 5))
+
+# Most results (such as transaction summaries) cached by each worker process
+CACHE_SIZE = int(os.environ.get('CACHE_SIZE', 1024))
+
+# Password hashing work factor (each step doubles the time it takes)
+BCRYPT_ROUNDS = int(os.environ.get('BCRYPT_ROUNDS', 12))
+
+# Threads that hash passwords for each worker process, and how many more
+# requests may wait for them before being turned away
+BCRYPT_THREADS = int(os.environ.get('BCRYPT_THREADS', 2))
+BCRYPT_QUEUE = int(os.environ.get('BCRYPT_QUEUE', 16))
+
+# Seconds each worker process remembers who owns an account (0 to not remember)
+ACCOUNT_OWNER_TTL = float(os.environ.get('ACCOUNT_OWNER_TTL', 0))
+
+# Statements slower than this many milliseconds are logged (0 to not log them)
+SLOW_QUERY_MS = float(os.environ.get('SLOW_QUERY_MS', 0))
+
+# Fraction of slow SELECT statements whose plans are captured with EXPLAIN
+# ANALYZE (which runs them a second time)
+SLOW_QUERY_EXPLAIN_RATE = float(os.environ.get('SLOW_QUERY_EXPLAIN_RATE', 0.1))
+
+# File the slow query log is written to ({pid} is replaced with the worker's
+# process ID), and how large it gets before it's rotated and how many old logs
+# are kept
+SLOW_QUERY_LOG = os.environ.get('SLOW_QUERY_LOG', 'slow-queries.log')
+SLOW_QUERY_LOG_BYTES = int(os.environ.get('SLOW_QUERY_LOG_BYTES', 10485760))
+SLOW_QUERY_LOG_BACKUPS = int(os.environ.get('SLOW_QUERY_LOG_BACKUPS', 5))
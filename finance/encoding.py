@@ -0,0 +1,111 @@
+"""Finance JSON encoding."""
+
+import datetime
+import decimal
+import finance
+import flask.json.provider
+import json
+
+# orjson is much faster than the standard library, but might not be installed
+try:
+
+    import orjson
+
+except ImportError:
+
+    orjson = None
+
+def default(value):
+    """
+    Encode a value that JSON has no type for.
+
+    Parameters:
+    - value: value to encode
+
+    Returns:
+    - JSON-serializable value
+    """
+
+    # Send amounts as strings so they keep their exact value
+    if isinstance(value, decimal.Decimal):
+
+        return str(value)
+
+    # Send dates as YYYY-MM-DD
+    if isinstance(value, datetime.date):
+
+        return value.isoformat()
+
+    raise TypeError(f'Object of type {type(value).__name__} is not JSON serializable')
+
+class JSONProvider(flask.json.provider.JSONProvider):
+    """
+    JSON provider that encodes dates and decimals natively, using orjson when
+    it's installed and the standard library when it isn't.
+    """
+
+    def encode(self, obj):
+        """
+        Encode a value as JSON.
+
+        Parameters:
+        - obj: value to encode
+
+        Returns:
+        - UTF-8 encoded JSON bytes
+        """
+
+        if orjson:
+
+            return orjson.dumps(obj, default=default, option=orjson.OPT_NON_STR_KEYS)
+
+        return json.dumps(obj, default=default, separators=(',', ':')).encode()
+
+    def dumps(self, obj, **kwargs):
+        """
+        Encode a value as a JSON string.
+
+        Parameters:
+        - obj: value to encode
+        - kwargs: ignored
+
+        Returns:
+        - JSON string
+        """
+
+        return self.encode(obj).decode()
+
+    def loads(self, s, **kwargs):
+        """
+        Decode a JSON string.
+
+        Parameters:
+        - s: JSON string or bytes
+        - kwargs: ignored
+
+        Returns:
+        - Decoded value
+        """
+
+        if orjson:
+
+            return orjson.loads(s)
+
+        return json.loads(s)
+
+    def response(self, *args, **kwargs):
+        """
+        Make a JSON response, writing the encoded bytes straight into its body.
+
+        Parameters:
+        - args: value to encode, or several values to encode as a list
+        - kwargs: values to encode as an object
+
+        Returns:
+        - Response Object
+        """
+
+        return self._app.response_class(self.encode(self._prepare_response_obj(args, kwargs)), mimetype='application/json')
+
+# Encode responses (and decode requests) with this provider
+finance.app.json = JSONProvider(finance.app)
@@ -0,0 +1,166 @@
+"""Finance ledger."""
+
+import finance
+import psycopg
+import random
+import time
+
+def retry(db, work):
+    """
+    Run a unit of work in its own transaction (or savepoint), running it again
+    from the start if it loses a race with a concurrent transaction.
+
+    Parameters:
+    - db: database connection
+    - work: function() -> result that performs the unit of work
+
+    Returns:
+    - Result of the unit of work
+    """
+
+    attempts = finance.app.config['LEDGER_RETRIES'] + 1
+
+    for attempt in range(attempts):
+
+        try:
+
+            with db.transaction():
+
+                return work()
+
+        # Serialization failures and deadlocks roll back safely and can be retried
+        except (psycopg.errors.SerializationFailure, psycopg.errors.DeadlockDetected):
+
+            if attempt + 1 == attempts:
+
+                raise
+
+            # Back off for a moment so the competing transaction can finish
+            time.sleep(random.uniform(0, 0.01 * 2 ** attempt))
+
+def lock(db, owner, ids):
+    """
+    Lock a user's accounts against concurrent balance changes. Accounts are
+    always locked in order of their identifiers so that two transactions
+    locking the same accounts can't deadlock.
+
+    Parameters:
+    - db: database connection
+    - owner: user identifier
+    - ids: account identifiers
+
+    Returns:
+    - Dictionary of the locked accounts, keyed by identifier (accounts that
+      don't exist or belong to someone else are left out)
+    """
+
+    return {account['id']: account for account in db.execute("SELECT id, balance FROM accounts WHERE owner = %s AND id = ANY(%s) ORDER BY id FOR UPDATE;", [
+        owner,
+        sorted(set(ids))
+    ]).fetchall()}
+
+def adjust(db, deltas):
+    """
+    Apply changes to account balances atomically in the database. Accounts
+    should be locked first.
+
+    Parameters:
+    - db: database connection
+    - deltas: dictionary of balance changes in cents, keyed by account identifier
+
+    Returns:
+    - None
+    """
+
+    db.execute(
+        "UPDATE accounts SET balance = balance + deltas.delta "
+        "FROM unnest(%s::bigint[], %s::bigint[]) AS deltas (id, delta) "
+        "WHERE accounts.id = deltas.id;", [
+        list(deltas.keys()),
+        list(deltas.values())
+    ])
+
+def record(db, legs):
+    """
+    Record changes to account balances in the daily balance history. Must be
+    called before the changes are applied with adjust().
+
+    Parameters:
+    - db: database connection
+    - legs: list of (account identifier, date, balance change in cents) tuples
+
+    Returns:
+    - None
+    """
+
+    db.execute("SELECT record_balances(%s::bigint[], %s::date[], %s::bigint[]);", [
+        [account for account, date, delta in legs],
+        [date for account, date, delta in legs],
+        [delta for account, date, delta in legs]
+    ])
+
+def transfer(db, owner, fields):
+    """
+    Transfer money between two of a user's accounts. The whole transfer is made
+    by a single call to a database function (see create_transfer()).
+
+    Parameters:
+    - db: database connection
+    - owner: user identifier
+    - fields: dictionary of validated transfer fields
+
+    Returns:
+    - Tuple of (transaction, None) if the transfer was made, or
+      (None, error message) if it was not
+    """
+
+    def work():
+
+        transaction = finance.model.query(db, 'transfer', [
+            owner,
+            fields['amount'],
+            fields['date'],
+            fields['source'],
+            fields['target']
+        ]).fetchone()
+
+        # Verify that both accounts exist (and belong to the user)
+        error = transaction.pop('error')
+
+        return (None, error) if error else (transaction, None)
+
+    return retry(db, work)
+
+def interest(db, owner, fields):
+    """
+    Record interest accrued by one of a user's accounts. The whole transaction
+    is recorded by a single call to a database function (see
+    create_interest()).
+
+    Parameters:
+    - db: database connection
+    - owner: user identifier
+    - fields: dictionary of validated interest fields
+
+    Returns:
+    - Tuple of (transaction, None) if the interest was recorded, or
+      (None, error message) if it was not
+    """
+
+    def work():
+
+        transaction = finance.model.query(db, 'interest', [
+            owner,
+            fields['amount'],
+            fields['date'],
+            fields['account'],
+            fields['startdate'],
+            fields['enddate']
+        ]).fetchone()
+
+        # Verify that the account exists (and belongs to the user)
+        error = transaction.pop('error')
+
+        return (None, error) if error else (transaction, None)
+
+    return retry(db, work)
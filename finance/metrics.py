@@ -0,0 +1,75 @@
+"""Finance metrics."""
+
+import finance
+import flask
+import prometheus_client
+import time
+
+# How long each request takes and how it turns out, by endpoint
+request_seconds = prometheus_client.Histogram('finance_request_duration_seconds', 'Time spent handling requests', ['endpoint', 'method'])
+requests = prometheus_client.Counter('finance_requests_total', 'Requests handled', ['endpoint', 'method', 'status'])
+
+# How much each request uses the database, by endpoint
+db_statements = prometheus_client.Histogram('finance_request_db_statements', 'SQL statements run per request', ['endpoint'], buckets=(0, 1, 2, 3, 5, 8, 13, 21, 34, 55))
+db_seconds = prometheus_client.Histogram('finance_request_db_seconds', 'Time spent running SQL statements per request', ['endpoint'])
+
+# How busy the database connection pools are, by pool (the primary's is named
+# finance and the read replica's finance-replica), added up across workers
+pool_size = prometheus_client.Gauge('finance_db_pool_size', 'Connections open', ['pool'], multiprocess_mode='livesum')
+pool_available = prometheus_client.Gauge('finance_db_pool_available', 'Connections open and not in use', ['pool'], multiprocess_mode='livesum')
+pool_max = prometheus_client.Gauge('finance_db_pool_max', 'Most connections that may be open', ['pool'], multiprocess_mode='livesum')
+pool_waiting = prometheus_client.Gauge('finance_db_pool_waiting', 'Requests waiting for a connection', ['pool'], multiprocess_mode='livesum')
+pool_wait_seconds = prometheus_client.Gauge('finance_db_pool_wait_seconds', 'Time spent waiting for a connection since the pool opened', ['pool'], multiprocess_mode='livesum')
+
+@finance.app.before_request
+def start():
+    """
+    Note when a request started, and how much it had already used the database
+    (requests made inside a batch share the batch's connection).
+
+    Parameters:
+    - None
+
+    Returns:
+    - None
+    """
+
+    flask.request.environ['finance.started'] = (time.perf_counter(), flask.g.get('db_statements', 0), flask.g.get('db_seconds', 0))
+
+@finance.app.after_request
+def observe(response):
+    """
+    Record how long a request took, how it turned out, and how much it used the
+    database.
+
+    Parameters:
+    - response: Response Object
+
+    Returns:
+    - Response Object
+    """
+
+    endpoint = flask.request.endpoint or 'none'
+    started, statements, seconds = flask.request.environ.get('finance.started', (None, 0, 0))
+
+    # Requests turned away before they started have no start time
+    if started is not None:
+
+        request_seconds.labels(endpoint, flask.request.method).observe(time.perf_counter() - started)
+
+    requests.labels(endpoint, flask.request.method, response.status_code).inc()
+    db_statements.labels(endpoint).observe(flask.g.get('db_statements', 0) - statements)
+    db_seconds.labels(endpoint).observe(flask.g.get('db_seconds', 0) - seconds)
+
+    # Take a look at the pools while the request's connection is still checked out
+    if 'db' in flask.g:
+
+        for name, stats in finance.model.stats().items():
+
+            pool_size.labels(name).set(stats.get('pool_size', 0))
+            pool_available.labels(name).set(stats.get('pool_available', 0))
+            pool_max.labels(name).set(stats.get('pool_max', 0))
+            pool_waiting.labels(name).set(stats.get('requests_waiting', 0))
+            pool_wait_seconds.labels(name).set(stats.get('requests_wait_ms', 0) / 1000)
+
+    return response
@@ -1,14 +1,317 @@
 """Finance database model."""
 
+import collections
 import finance
 import flask
+import json
+import logging
+import logging.handlers
+import os
 import psycopg
+import psycopg_pool
+import random
+import threading
+import time
+
+# Each worker process keeps its own pools (one for the primary and, if there is
+# one, one for the read replica), created on first use so that they are never
+# shared across a fork
+_pools = {}
+_pool_lock = threading.Lock()
+
+# Queries run on the hot paths of the application, by name
+queries = {
+    'account': "SELECT id, owner, type, name, balance FROM accounts WHERE id = ANY(%s);",
+    'transaction': (
+        "SELECT transactions.id, transactions.type, transactions.amount, transactions.date, "
+        "transfers.source, transfers.target, interest.account, interest.startdate, interest.enddate "
+        "FROM transactions "
+        "LEFT JOIN transfers ON transfers.id = transactions.id "
+        "LEFT JOIN interest ON interest.id = transactions.id "
+        "WHERE transactions.id = %s AND transactions.owner = %s;"
+    ),
+    'version': "SELECT version FROM users WHERE id = %s;",
+    'transfer': "SELECT * FROM create_transfer(%s, %s::bigint, %s::date, %s, %s);",
+    'interest': "SELECT * FROM create_interest(%s, %s::bigint, %s::date, %s, %s::date, %s::date);"
+}
+
+# Number of times each named query has run in this worker process
+_usage = collections.Counter()
+_usage_lock = threading.Lock()
+
+# Log of slow statements, opened on first use
+_slow_log = None
+_slow_log_lock = threading.Lock()
+
+# Parts of SELECT statements that take locks or (through the ledger functions)
+# change data, which mustn't be run a second time just to see their plans
+_slow_writes = ['create_transfer(', 'create_interest(', 'record_balances(', 'FOR UPDATE']
+
+def shape(params):
+    """
+    Describe statement parameters without giving away their values.
+
+    Parameters:
+    - params: statement parameters
+
+    Returns:
+    - List of parameter types (with the length of any lists), or None if there
+      are no parameters
+    """
+
+    if params is None:
+
+        return None
+
+    if isinstance(params, dict):
+
+        return {key: shape([value])[0] for key, value in params.items()}
+
+    return [f'{type(value).__name__}[{len(value)}]' if isinstance(value, (list, tuple)) else type(value).__name__ for value in params]
+
+def slow(cursor, query, params, seconds, explain):
+    """
+    Write a statement that took longer than SLOW_QUERY_MS to the slow query log,
+    along with the route that ran it. Each worker process may write to its own
+    log by putting {pid} in SLOW_QUERY_LOG. A sample of slow SELECT statements are run
+    again under EXPLAIN (ANALYZE, BUFFERS) to capture their plans, in a savepoint
+    that is rolled back afterwards. Statements that take locks or change data
+    are only planned with EXPLAIN, without running them again.
+
+    Parameters:
+    - cursor: cursor that ran the statement
+    - query: SQL statement
+    - params: statement parameters
+    - seconds: how long the statement took
+    - explain: whether the statement succeeded, so its plan can be captured
+
+    Returns:
+    - None
+    """
+
+    global _slow_log
+
+    # Open the log the first time it's needed
+    if _slow_log is None:
+
+        with _slow_log_lock:
+
+            if _slow_log is None:
+
+                handler = logging.handlers.RotatingFileHandler(
+                    finance.app.config['SLOW_QUERY_LOG'].format(pid=os.getpid()),
+                    maxBytes=finance.app.config['SLOW_QUERY_LOG_BYTES'],
+                    backupCount=finance.app.config['SLOW_QUERY_LOG_BACKUPS']
+                )
+                handler.setFormatter(logging.Formatter('%(asctime)s %(message)s'))
+
+                logger = logging.getLogger('finance.slow_queries')
+                logger.setLevel(logging.INFO)
+                logger.propagate = False
+                logger.addHandler(handler)
+
+                _slow_log = logger
+
+    sql = query if isinstance(query, str) else query.decode() if isinstance(query, bytes) else query.as_string(cursor)
+
+    entry = {
+        'endpoint': flask.request.endpoint if flask.has_request_context() else None,
+        'duration_ms': round(seconds * 1000, 3),
+        'query': sql,
+        'params': shape(params),
+        'plan': None
+    }
+
+    # Only SELECT statements are explained, and only some of them
+    if explain and sql.lstrip().upper().startswith('SELECT') and random.random() < finance.app.config['SLOW_QUERY_EXPLAIN_RATE']:
+
+        try:
+
+            with cursor.connection.transaction(force_rollback=True):
+
+                command = 'EXPLAIN' if any(write in sql for write in _slow_writes) else 'EXPLAIN (ANALYZE, BUFFERS)'
+
+                # Use a plain cursor so the plan isn't timed (or explained) too
+                plan = psycopg.Cursor(cursor.connection, row_factory=psycopg.rows.tuple_row).execute(f'{command} {sql}', params)
+                entry['plan'] = '\n'.join(row[0] for row in plan.fetchall())
+
+        except psycopg.Error as e:
+
+            entry['plan'] = f'Failed to explain: {e}'
+
+    _slow_log.info(json.dumps(entry))
+
+class Cursor(psycopg.Cursor):
+    """
+    Database cursor that keeps count of the statements each request runs and
+    how long they take, in Flask's global context, and logs statements that are
+    slow.
+    """
+
+    def execute(self, query, params = None, **kwargs):
+        """
+        Run a statement, timing how long it takes.
+
+        Parameters:
+        - query: SQL statement
+        - params: statement parameters
+        - kwargs: other options for psycopg's execute()
+
+        Returns:
+        - The cursor itself
+        """
+
+        start = time.perf_counter()
+        succeeded = False
+
+        try:
+
+            cursor = super().execute(query, params, **kwargs)
+            succeeded = True
+
+            return cursor
+
+        finally:
+
+            seconds = time.perf_counter() - start
+
+            # Only count statements run on behalf of a request
+            if flask.has_app_context():
+
+                flask.g.db_statements = flask.g.get('db_statements', 0) + 1
+                flask.g.db_seconds = flask.g.get('db_seconds', 0) + seconds
+
+            # Log statements that took too long, if asked to
+            if finance.app.config['SLOW_QUERY_MS'] and seconds * 1000 >= finance.app.config['SLOW_QUERY_MS']:
+
+                # Failing to log a statement mustn't fail the statement
+                try:
+
+                    slow(self, query, params, seconds, succeeded)
+
+                except Exception as e:
+
+                    finance.app.logger.warning(f'Failed to log slow statement: {e}')
+
+def pool(replica = False):
+    """
+    Get one of the database connection pools for this worker process. Database
+    credentials and pool settings are sourced from the application
+    configuration.
+
+    Parameters:
+    - replica: whether to get the read replica's pool instead of the primary's
+
+    Returns:
+    - PostgreSQL connection pool object
+    """
+
+    name = 'finance-replica' if replica else 'finance'
+
+    # Create the pool the first time it's needed
+    if name not in _pools:
+
+        with _pool_lock:
+
+            if name not in _pools:
+
+                kwargs = {
+                    'user': finance.app.config['DB_USER'],
+                    'password': finance.app.config['DB_PASSWORD'],
+                    'host': finance.app.config['DB_REPLICA_HOST' if replica else 'DB_HOST'],
+                    'port': finance.app.config['DB_REPLICA_PORT' if replica else 'DB_PORT'],
+                    'dbname': finance.app.config['DB_NAME'],
+                    'row_factory': psycopg.rows.dict_row,
+                    'cursor_factory': Cursor
+                }
+
+                # Refuse to write to the replica, even if it would let us
+                if replica:
+
+                    kwargs['options'] = '-c default_transaction_read_only=on'
+
+                _pools[name] = psycopg_pool.ConnectionPool(
+                    kwargs=kwargs,
+                    min_size=finance.app.config['DB_POOL_MIN_SIZE'],
+                    max_size=finance.app.config['DB_POOL_MAX_SIZE'],
+                    timeout=finance.app.config['DB_POOL_TIMEOUT'],
+                    max_lifetime=finance.app.config['DB_POOL_MAX_LIFETIME'],
+                    max_idle=finance.app.config['DB_POOL_MAX_IDLE'],
+                    # Make sure connections still work before handing them out
+                    check=psycopg_pool.ConnectionPool.check_connection,
+                    name=name,
+                    open=True
+                )
+
+    return _pools[name]
+
+def stats():
+    """
+    Get usage statistics for each of this worker's database connection pools
+    that has been opened.
+
+    Parameters:
+    - None
+
+    Returns:
+    - Dictionary of pool statistics (see psycopg_pool's get_stats()), keyed by
+      pool name
+    """
+
+    return {name: open_pool.get_stats() for name, open_pool in list(_pools.items())}
+
+def reading():
+    """
+    Check whether the current request can be served by the read replica. Only
+    GET and HEAD requests are, and not for a user who changed something in the
+    last REPLICA_STICKY_SECONDS (so they always see their own changes).
+
+    Parameters:
+    - None
+
+    Returns:
+    - True if the request should use the replica, False if it should use the
+      primary
+    """
+
+    if not (finance.app.config['DB_REPLICA_HOST'] and flask.has_request_context()):
+
+        return False
+
+    if flask.request.method not in ['GET', 'HEAD']:
+
+        return False
+
+    return time.time() - flask.session.get('wrote', 0) >= finance.app.config['REPLICA_STICKY_SECONDS']
+
+@finance.app.after_request
+def stick(response):
+    """
+    Note when a user last changed something, in their session, so that their
+    reads go to the primary for a while afterwards (see reading()).
+
+    Parameters:
+    - response: Response Object
+
+    Returns:
+    - Response Object
+    """
+
+    if finance.app.config['DB_REPLICA_HOST'] and flask.request.method not in ['GET', 'HEAD', 'OPTIONS']:
+
+        # Failed requests don't change anything, and logged out users have no session
+        if response.status_code < 400 and 'id' in flask.session:
+
+            flask.session['wrote'] = time.time()
+
+    return response
 
 def connect():
     """
-    Connect to the database. Database credentials are sourced from the
-    application configuration.
-    
+    Borrow a database connection from the pool, from the read replica's if the
+    request can be served by it (see reading()). The connection is kept in
+    Flask's global context for the rest of the request.
+
     Parameters:
     - None
 
@@ -19,26 +322,57 @@ def connect():
     # Check whether a database connection exists in Flask's global context
     if 'db' not in flask.g:
 
-        # If it does not exist, connect to the database
-        flask.g.db = psycopg.connect(
-            user=finance.app.config['DB_USER'],
-            password=finance.app.config['DB_PASSWORD'],
-            host=finance.app.config['DB_HOST'],
-            port=finance.app.config['DB_PORT'],
-            dbname=finance.app.config['DB_NAME'],
-            row_factory=psycopg.rows.dict_row
-        )
+        # If it does not exist, borrow one from the pool
+        flask.g.db_replica = reading()
+        flask.g.db = pool(flask.g.db_replica).getconn()
 
     return flask.g.db
 
+def query(db, name, values):
+    """
+    Run a named query. Each pooled connection prepares the query on the
+    database server the first time it runs it, so later runs skip parsing and
+    planning.
+
+    Parameters:
+    - db: database connection
+    - name: name of the query
+    - values: query parameters
+
+    Returns:
+    - Cursor holding the query's results
+    """
+
+    with _usage_lock:
+
+        _usage[name] += 1
+
+    return db.execute(queries[name], values, prepare=True)
+
+def usage():
+    """
+    Get the number of times each named query has run in this worker process.
+
+    Parameters:
+    - None
+
+    Returns:
+    - Dictionary of run counts, keyed by query name
+    """
+
+    with _usage_lock:
+
+        return dict(_usage)
+
 @finance.app.teardown_appcontext
 def close(error = None):
     """
-    Commit any pending transactions and close the database connection.
+    Commit or roll back any pending transaction and return the database
+    connection to the pool.
 
     Parameters:
     - error: error, if detected
-    
+
     Returns:
     - None
     """
@@ -52,10 +386,21 @@ def close(error = None):
         # If we found a connection, check whether it's open
         if not (db.closed):
 
-            # Commit any changes unless there was an error
-            if not flask.g.pop('exception', None):
-                
-                db.commit()
-            
-            # Close the connection
-            db.close()
\ No newline at end of file
+            try:
+
+                # Commit any changes unless there was an error
+                if error is None and not flask.g.pop('exception', None):
+
+                    db.commit()
+
+                else:
+
+                    db.rollback()
+
+            # A broken connection is discarded by the pool when returned
+            except psycopg.Error as e:
+
+                finance.app.logger.warning(f'Failed to end transaction: {e}')
+
+        # Return the connection to the pool it came from
+        pool(flask.g.pop('db_replica', False)).putconn(db)
@@ -0,0 +1,100 @@
+"""Finance password hashing."""
+
+import bcrypt
+import concurrent.futures
+import finance
+import threading
+
+# Each worker process hashes passwords on its own small pool of threads, created
+# on first use so that it is never shared across a fork
+_executor = None
+_executor_lock = threading.Lock()
+_slots = None
+
+def run(function, *args):
+    """
+    Run a password hashing function on the hashing threads and wait for the
+    result. bcrypt releases the GIL while it works, so other requests keep
+    running in the meantime. Work is turned away instead of queued once too
+    many requests are already waiting.
+
+    Parameters:
+    - function: function to run
+    - args: arguments for the function
+
+    Returns:
+    - Tuple of (result, None) if the function ran, or (None, error message) if
+      the hashing threads are too busy
+    """
+
+    global _executor, _slots
+
+    # Create the hashing threads the first time they're needed
+    if _executor is None:
+
+        with _executor_lock:
+
+            if _executor is None:
+
+                _slots = threading.BoundedSemaphore(finance.app.config['BCRYPT_THREADS'] + finance.app.config['BCRYPT_QUEUE'])
+                _executor = concurrent.futures.ThreadPoolExecutor(
+                    max_workers=finance.app.config['BCRYPT_THREADS'],
+                    thread_name_prefix='bcrypt'
+                )
+
+    # Take a place in line, if there is one
+    if not _slots.acquire(blocking=False):
+
+        return None, 'Server is too busy, try again later'
+
+    try:
+
+        return _executor.submit(function, *args).result(), None
+
+    finally:
+
+        _slots.release()
+
+def hash(password):
+    """
+    Hash a password with the configured work factor.
+
+    Parameters:
+    - password: password string
+
+    Returns:
+    - Tuple of (hash, None) if the password was hashed, or (None, error message)
+      if it was not
+    """
+
+    return run(bcrypt.hashpw, password.encode(), bcrypt.gensalt(finance.app.config['BCRYPT_ROUNDS']))
+
+def check(password, hashed):
+    """
+    Check a password against a stored hash.
+
+    Parameters:
+    - password: password string
+    - hashed: stored hash
+
+    Returns:
+    - Tuple of (True if the password matches, None) if it was checked, or
+      (None, error message) if it was not
+    """
+
+    return run(bcrypt.checkpw, password.encode(), bytes(hashed))
+
+def outdated(hashed):
+    """
+    Check whether a stored hash was made with a different work factor than the
+    one currently configured.
+
+    Parameters:
+    - hashed: stored hash
+
+    Returns:
+    - True if the password should be hashed again, otherwise False
+    """
+
+    # Hashes look like $2b$12$..., where 12 is the work factor
+    return int(bytes(hashed).split(b'$')[2]) != finance.app.config['BCRYPT_ROUNDS']
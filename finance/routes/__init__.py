@@ -1,7 +1,12 @@
 """Finance routes initializer."""
 
+import base64
+import binascii
+import decimal
 import finance
 import flask
+import hashlib
+import json
 import werkzeug.exceptions
 
 # Simplify response construction in controllers
@@ -16,7 +21,7 @@ def response_maker(url):
     - function(dict, dict, int) -> Response
     """
 
-    def make_response(data = {}, headers = {}, status_code = None):
+    def make_response(data = None, headers = {}, status_code = None):
         """
         Make a response from data, headers, and status code.
 
@@ -29,9 +34,10 @@ def response_maker(url):
         - Response Object
         """
 
-        default = {'url': url}
-        default.update(data)
-        response = flask.jsonify(default)
+        # Include the URL unless the data already has one
+        data = {'url': url} if data is None else data
+        data.setdefault('url', url)
+        response = flask.jsonify(data)
         response.headers.extend(headers)
 
         if status_code:
@@ -42,6 +48,224 @@ def response_maker(url):
     
     return make_response
 
+# Convert money between the API (dollars) and the database (whole cents)
+def to_cents(amount):
+    """
+    Convert an amount of money given to the API in dollars to a whole number of
+    cents.
+
+    Parameters:
+    - amount: number of dollars
+
+    Returns:
+    - Tuple of (number of cents, None) if the amount can be stored, or
+      (None, what's wrong with it) if it can't
+    """
+
+    # Booleans pass for integers in Python, but they aren't amounts of money
+    if isinstance(amount, bool):
+
+        return None, 'must be a number'
+
+    # Work from the shortest decimal form of the number, so that 0.1 is exactly 10 cents
+    cents = decimal.Decimal(repr(amount)).scaleb(2)
+
+    if not cents.is_finite() or cents != cents.to_integral_value():
+
+        return None, 'must have at most 2 decimal places'
+
+    if abs(cents) >= 2 ** 63:
+
+        return None, 'is too large'
+
+    return int(cents), None
+
+def from_cents(cents):
+    """
+    Convert a whole number of cents from the database to dollars for the API.
+
+    Parameters:
+    - cents: number of cents, or None
+
+    Returns:
+    - Number of dollars, or None
+    """
+
+    return cents / 100 if cents is not None else None
+
+# Read lists of identifiers for looking up many rows at once
+def parse_ids(text):
+    """
+    Read a comma-separated list of identifiers, such as from an ids query
+    parameter.
+
+    Parameters:
+    - text: comma-separated identifiers
+
+    Returns:
+    - Tuple of (list of distinct identifiers, None) if the list is valid, or
+      (None, error message) if it is not
+    """
+
+    try:
+
+        ids = list(dict.fromkeys(int(id) for id in text.split(',')))
+
+    except ValueError:
+
+        return None, 'IDs must be a comma-separated list of integers'
+
+    # Keep each request to a reasonable size
+    if len(ids) > finance.app.config['MULTI_GET_LIMIT']:
+
+        return None, 'Cannot look up more than %d IDs at once' % finance.app.config['MULTI_GET_LIMIT']
+
+    return ids, None
+
+# Build and read opaque page cursors for keyset pagination
+def encode_cursor(values):
+    """
+    Encode the sort key of the last row on a page as an opaque cursor.
+
+    Parameters:
+    - values: list of JSON-serializable sort key values
+
+    Returns:
+    - Cursor string
+    """
+
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode().rstrip('=')
+
+def decode_cursor(cursor, length):
+    """
+    Decode an opaque cursor back into the sort key it was built from.
+
+    Parameters:
+    - cursor: cursor string
+    - length: number of values the cursor should contain
+
+    Returns:
+    - List of sort key values, or None if the cursor is invalid
+    """
+
+    try:
+
+        values = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+
+        return None
+
+    # Make sure the cursor holds the right number of values
+    if not (isinstance(values, list) and len(values) == length):
+
+        return None
+
+    return values
+
+# Tag responses so that clients can skip downloading what they already have
+def entity_tag(db):
+    """
+    Compute a strong entity tag for the logged-in user's view of the requested
+    URL. The tag changes whenever the user's accounts or transactions do, so it
+    can be checked without running the request's main query.
+
+    Parameters:
+    - db: database connection
+
+    Returns:
+    - Entity tag (without quotes)
+    """
+
+    version = finance.cache.version(db, flask.session['id'])
+
+    return hashlib.sha1(f"{flask.session['id']}:{version}:{flask.request.full_path}".encode()).hexdigest()
+
+def tag_headers(tag):
+    """
+    Make the headers that let clients revalidate a tagged response.
+
+    Parameters:
+    - tag: entity tag (without quotes)
+
+    Returns:
+    - Dictionary of response headers
+    """
+
+    return {
+        'ETag': f'"{tag}"',
+        'Cache-Control': 'private, no-cache'
+    }
+
+def not_modified(tag):
+    """
+    Make an empty response telling the client that its copy is still current.
+
+    Parameters:
+    - tag: entity tag (without quotes)
+
+    Returns:
+    - Response Object
+    """
+
+    return flask.Response(status=304, headers=tag_headers(tag))
+
+# Check account ownership once per request
+def resolve_accounts(db, ids):
+    """
+    Find which of the given accounts belong to the logged-in user. Accounts that
+    this request hasn't looked up yet are loaded in a single query and kept for
+    the rest of the request. If ACCOUNT_OWNER_TTL is set, accounts that were
+    recently seen to belong to someone else are skipped without a query.
+
+    Parameters:
+    - db: database connection
+    - ids: account identifiers
+
+    Returns:
+    - Dictionary of the user's accounts among those given, keyed by identifier
+    """
+
+    resolved = flask.g.setdefault('accounts', {})
+    ttl = finance.app.config['ACCOUNT_OWNER_TTL']
+    missing = set()
+
+    for id in ids:
+
+        if id in resolved:
+
+            continue
+
+        owner = finance.cache.get(('owner', id)) if ttl else None
+
+        # An account's owner never changes, so there's no need to ask again
+        if owner is not None and owner != flask.session['id']:
+
+            resolved[id] = None
+
+        else:
+
+            missing.add(id)
+
+    # Load every account we haven't seen yet at once
+    if missing:
+
+        resolved.update(dict.fromkeys(missing))
+
+        for account in finance.model.query(db, 'account', [
+            sorted(missing)
+        ]).fetchall():
+
+            if ttl:
+
+                finance.cache.put(('owner', account['id']), account['owner'], ttl)
+
+            if account.pop('owner') == flask.session['id']:
+
+                resolved[account['id']] = account
+
+    return {id: resolved[id] for id in ids if resolved[id] is not None}
+
 # Return JSON instead of HTML for HTTP errors
 @finance.app.errorhandler(werkzeug.exceptions.HTTPException)
 def handle_exception(e):
@@ -61,4 +285,6 @@ from . import index
 from . import auth
 from . import users
 from . import accounts
-from . import transactions
\ No newline at end of file
+from . import transactions
+from . import batch
+from . import metrics
\ No newline at end of file
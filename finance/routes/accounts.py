@@ -1,5 +1,6 @@
 """Accounts API controller."""
 
+import datetime
 import finance
 import flask
 
@@ -8,6 +9,12 @@ account_types = {
     1: "Savings"
 }
 
+balance_intervals = {
+    'day': '1 day',
+    'week': '1 week',
+    'month': '1 month'
+}
+
 blueprint = flask.Blueprint('accounts', __name__, url_prefix='/accounts')
 
 @blueprint.route('/types', methods=['GET'])
@@ -42,9 +49,11 @@ def index():
     """
 
     parameters = {key: flask.request.args[key] for key in flask.request.args if key in [
+        'ids',
         'type',
         'size',
-        'page'
+        'page',
+        'cursor'
     ]} if flask.request.method == 'GET' else {}
     make_response = finance.routes.response_maker(flask.url_for('accounts.index', **parameters))
 
@@ -67,6 +76,21 @@ def index():
             flask.session['id']
         ]
     
+        ids = None
+
+        # Check for account IDs
+        if 'ids' in flask.request.args:
+
+            ids, error = finance.routes.parse_ids(flask.request.args['ids'])
+
+            if error:
+
+                return make_response(data={'error': error}, status_code=400)
+
+            # Add the ID filter to the query
+            query += " AND id = ANY(%s)"
+            values.append(ids)
+
         # Check for account type filter
         if 'type' in flask.request.args:
 
@@ -90,9 +114,6 @@ def index():
 
                     return make_response(data={'error': 'Invalid account type'}, status_code=400)
         
-        # Sort the results alphabetically
-        query += " ORDER BY name ASC"
-
         page_size = 5
 
         # Check for page size
@@ -131,39 +152,75 @@ def index():
 
                     return make_response(data={'error': 'Invalid page number'}, status_code=400)
         
-        # Add the page filter to the query
-        query += " LIMIT %s OFFSET %s"
-        values.append(page_size)
-        values.append(page_number * page_size)
+        cursor = None
+
+        # Check for page cursor
+        if 'cursor' in flask.request.args:
+
+            cursor = finance.routes.decode_cursor(flask.request.args['cursor'], 2)
+
+            # Verify that it holds an account name and ID
+            if not (cursor and isinstance(cursor[0], str) and isinstance(cursor[1], int)):
+
+                return make_response(data={'error': 'Invalid cursor'}, status_code=400)
+
+            # Resume after the last account of the previous page
+            query += " AND (name, id) > (%s, %s)"
+            values.extend(cursor)
+
+        # Sort the results alphabetically
+        query += " ORDER BY name ASC, id ASC"
+
+        # Add the page filter to the query (page numbers are only honored without a cursor,
+        # and accounts asked for by ID all come back at once)
+        if ids is None:
+
+            query += " LIMIT %s OFFSET %s"
+            values.append(page_size)
+            values.append(0 if cursor else page_number * page_size)
         
         # Connect to the database
         db = finance.model.connect()
 
+        tag = finance.routes.entity_tag(db)
+
+        # Skip the search if the client already has the latest list of accounts
+        if flask.request.if_none_match.contains(tag):
+
+            return finance.routes.not_modified(tag)
+
         # Search the database for accounts with the given filter
         accounts = db.execute(query + ";", values).fetchall()
 
         # Format each account before returning the response
         for account in accounts:
 
-            # Include the account's URL in the response
-            account['url'] = flask.url_for('accounts.detail', id=account['id'])
+            # Include the account's balance in dollars and URL in the response
+            account.update({
+                'balance': finance.routes.from_cents(account['balance']),
+                'url': flask.url_for('accounts.detail', id=account['id'])
+            })
         
-        # Adjust the parameters for the next page
-        parameters['page'] = page_number + 1
+        # Adjust the parameters for the next page, if there might be one
+        parameters.pop('page', None)
+        parameters['cursor'] = finance.routes.encode_cursor([
+            accounts[-1]['name'],
+            accounts[-1]['id']
+        ]) if ids is None and page_size and len(accounts) == page_size else None
 
         # Return the list of accounts with the URL for the next page
         return make_response(data={
             'accounts': accounts,
-            'next': flask.url_for('accounts.index', **parameters)
-        }, status_code=200)
+            'next': flask.url_for('accounts.index', **parameters) if parameters['cursor'] else None
+        }, headers=finance.routes.tag_headers(tag), status_code=200)
 
     # If this is a POST request, create a new account
     elif flask.request.method == 'POST':
         
         # Verify that JSON payload is present in the request
-        if not flask.request.json:
+        if not flask.request.get_json(silent=True):
 
-            return make_response(data={'Request does not contain JSON payload'}, status_code=400)
+            return make_response(data={'error': 'Request does not contain JSON payload'}, status_code=400)
 
         # Verify that account type is present in JSON payload
         if 'type' in flask.request.json:
@@ -215,6 +272,13 @@ def index():
 
                 return make_response(data={'error': 'Account balance must be a number'}, status_code=400)
 
+            # Verify that it's a whole number of cents
+            balance, error = finance.routes.to_cents(flask.request.json['balance'])
+
+            if error:
+
+                return make_response(data={'error': f'Account balance {error}'}, status_code=400)
+
         # Connect to the database
         db = finance.model.connect()
 
@@ -223,15 +287,21 @@ def index():
             flask.session['id'],
             flask.request.json['type'],
             flask.request.json['name'],
-            flask.request.json['balance']
+            balance
         ]).fetchone() if 'balance' in flask.request.json else db.execute("INSERT INTO accounts (owner, type, name) VALUES (%s, %s, %s) RETURNING id, type, name, balance;", [
             flask.session['id'],
             flask.request.json['type'],
             flask.request.json['name']
         ]).fetchone()
 
-        # Include the account's URL in the response
-        account['url'] = flask.url_for('accounts.detail', id=account['id'])
+        # Let clients know that their copies of the user's accounts are out of date
+        finance.cache.bump(db, flask.session['id'])
+
+        # Include the account's balance in dollars and URL in the response
+        account.update({
+            'balance': finance.routes.from_cents(account['balance']),
+            'url': flask.url_for('accounts.detail', id=account['id'])
+        })
 
         # Return the account
         return make_response(data={'account': account}, status_code=201)
@@ -262,11 +332,17 @@ def detail(id):
     # Connect to the database
     db = finance.model.connect()
 
+    # If this is a GET request, skip the search if the client already has the latest copy of the account
+    if flask.request.method == 'GET':
+
+        tag = finance.routes.entity_tag(db)
+
+        if flask.request.if_none_match.contains(tag):
+
+            return finance.routes.not_modified(tag)
+
     # Search for an account with the specified ID owned by the logged-in user
-    account = db.execute("SELECT id, type, name, balance FROM accounts WHERE id = %s AND owner = %s;", [
-        id,
-        flask.session['id']
-    ]).fetchone()
+    account = finance.routes.resolve_accounts(db, [id]).get(id)
 
     # Make sure the account exists
     if account:
@@ -274,18 +350,30 @@ def detail(id):
         # If this is a DELETE request, delete the account
         if flask.request.method == 'DELETE':
 
+            # Delete the account's transactions along with it
+            db.execute("DELETE FROM transactions WHERE id IN ("
+            "SELECT id FROM transfers WHERE source = %s OR target = %s "
+            "UNION ALL SELECT id FROM interest WHERE account = %s);", [
+                id,
+                id,
+                id
+            ])
+
             db.execute("DELETE FROM accounts WHERE id = %s AND owner = %s;", [
                 id,
                 flask.session['id']
             ])
 
+            # Invalidate anything cached from the user's ledger
+            finance.cache.bump(db, flask.session['id'])
+
             return make_response(data={}, status_code=204)
 
         # If this is a PUT/PATCH request, update the account details
         elif flask.request.method in ['PUT', 'PATCH']:
 
             # Verify that JSON payload is present in the request
-            if not flask.request.json:
+            if not flask.request.get_json(silent=True):
 
                 return make_response(data={'error': 'Request does not contain JSON payload'}, status_code=400)
 
@@ -355,11 +443,127 @@ def detail(id):
                 flask.session['id']
             ]).fetchone()
 
-        # Include the account's URL in the response
-        account['url'] = flask.url_for('accounts.detail', id=id)
+            # Let clients know that their copies of the user's accounts are out of date
+            finance.cache.bump(db, flask.session['id'])
 
-        # Return the account
-        return make_response(data={'account': account}, status_code=200)
+        # Include the account's balance in dollars and URL in the response
+        account.update({
+            'balance': finance.routes.from_cents(account['balance']),
+            'url': flask.url_for('accounts.detail', id=id)
+        })
+
+        # Return the account, tagged so that the client can check whether it changes
+        return make_response(data={'account': account}, headers=finance.routes.tag_headers(tag) if flask.request.method == 'GET' else {}, status_code=200)
+
+    else:
+
+        return make_response(data={'error': 'Account not found'}, status_code=404)
+
+@blueprint.route('/<int:id>/balances', methods=['GET'])
+def balances(id):
+    """
+    Show the history of an account's balance.
+
+    Parameters:
+    - id: account identifier
+
+    Returns:
+    - Response Object
+    """
+
+    parameters = {key: flask.request.args[key] for key in flask.request.args if key in [
+        'from',
+        'to',
+        'interval'
+    ]}
+    make_response = finance.routes.response_maker(flask.url_for('accounts.balances', id=id, **parameters))
+
+    # Require the user to authenticate
+    if 'id' not in flask.session:
+
+        return make_response(data={
+            'error': 'User is not logged in'
+        }, headers={
+            'WWW-Authenticate': 'Basic realm="Finance API"'
+        }, status_code=401)
+
+    end = datetime.date.today()
+
+    # Check for end date
+    if 'to' in flask.request.args:
+
+        try:
+
+            # Convert it to a date object
+            end = datetime.datetime.strptime(flask.request.args['to'], f'%Y-%m-%d').date()
+
+        except ValueError:
+
+            return make_response(data={'error': 'End date must be formatted as YYYY-MM-DD'}, status_code=400)
+
+    start = end - datetime.timedelta(days=30)
+
+    # Check for start date
+    if 'from' in flask.request.args:
+
+        try:
+
+            # Convert it to a date object
+            start = datetime.datetime.strptime(flask.request.args['from'], f'%Y-%m-%d').date()
+
+        except ValueError:
+
+            return make_response(data={'error': 'Start date must be formatted as YYYY-MM-DD'}, status_code=400)
+
+        # Verify that it isn't after the end date
+        if start > end:
+
+            return make_response(data={'error': 'Start date cannot be after end date'}, status_code=400)
+
+    interval = flask.request.args.get('interval', 'day')
+
+    # Verify that it's an interval we can group by
+    if interval not in balance_intervals:
+
+        return make_response(data={'error': 'Interval must be one of %s' % ', '.join(balance_intervals)}, status_code=400)
+
+    # Connect to the database
+    db = finance.model.connect()
+
+    # Search for an account with the specified ID owned by the logged-in user
+    account = finance.routes.resolve_accounts(db, [id]).get(id)
+
+    # Make sure the account exists
+    if account:
+
+        # Look up the balance at the end of each interval in the daily history
+        balances = db.execute(
+            "SELECT to_char(intervals.start, 'YYYY-MM-DD') AS date, COALESCE("
+            "(SELECT balances.balance FROM balances WHERE balances.account = %s "
+            "AND balances.date <= LEAST(intervals.start + %s::interval - INTERVAL '1 day', %s::date) "
+            "ORDER BY balances.date DESC LIMIT 1), "
+            "(SELECT balances.balance - balances.delta FROM balances WHERE balances.account = %s "
+            "ORDER BY balances.date ASC LIMIT 1), "
+            "%s) AS balance "
+            "FROM generate_series(date_trunc(%s, %s::date), %s::date, %s::interval) AS intervals (start);", [
+            id,
+            balance_intervals[interval],
+            end,
+            id,
+            account['balance'],
+            interval,
+            start,
+            end,
+            balance_intervals[interval]
+        ]).fetchall()
+
+        # Convert the balances to dollars
+        for balance in balances:
+
+            balance['balance'] = finance.routes.from_cents(balance['balance'])
+
+        # Return the balance history
+        return make_response(data={'balances': balances}, status_code=200)
 
     else:
 
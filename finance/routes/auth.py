@@ -2,7 +2,6 @@
 
 import finance
 import flask
-import bcrypt
 import re
 
 @finance.app.route('/login', methods = ['POST'])
@@ -25,7 +24,7 @@ def login():
         return make_reponse(data={'error': 'User is already logged in'}, status_code=403)
 
     # Verify that JSON payload is present in the request
-    if not flask.request.json:
+    if not flask.request.get_json(silent=True):
 
         return make_reponse(data={'error': 'Request does not contain JSON payload'}, status_code=400)
 
@@ -80,7 +79,27 @@ def login():
     if user:
 
         # If the user was found, check their password
-        if bcrypt.checkpw(flask.request.json['password'].encode(), bytes(user['password'])):
+        matches, error = finance.passwords.check(flask.request.json['password'], user['password'])
+
+        # Ask the client to try again later if the server is too busy to check
+        if error:
+
+            return make_reponse(data={'error': error}, headers={'Retry-After': '1'}, status_code=503)
+
+        if matches:
+
+            # Upgrade the stored hash if it was made with an old work factor
+            if finance.passwords.outdated(user['password']):
+
+                hash, error = finance.passwords.hash(flask.request.json['password'])
+
+                # It's fine to leave the upgrade until next time if the server is busy
+                if not error:
+
+                    db.execute("UPDATE users SET password = %s WHERE id = %s;", [
+                        hash,
+                        user['id']
+                    ])
 
             # If their password was right, log them in
             flask.session['id'] = user['id']
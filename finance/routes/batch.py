@@ -0,0 +1,204 @@
+"""Batch API controller."""
+
+import finance
+import flask
+import psycopg
+import werkzeug.test
+
+# Calls that change the session or would nest batches can't be made in a batch
+batch_excluded = [
+    'login',
+    'logout',
+    'batch'
+]
+
+batch_methods = [
+    'GET',
+    'HEAD',
+    'POST',
+    'PUT',
+    'PATCH',
+    'DELETE'
+]
+
+def validate(data):
+    """
+    Verify the fields of an API call made in a batch.
+
+    Parameters:
+    - data: call as decoded from the JSON payload
+
+    Returns:
+    - Tuple of (dictionary of call fields, None) if the call is valid, or
+      (None, error message) if it is not
+    """
+
+    if not isinstance(data, dict):
+
+        return None, 'Request must be an object'
+
+    fields = {
+        'method': data.get('method', 'GET'),
+        'url': data.get('url'),
+        'headers': data.get('headers', {}),
+        'body': data.get('body')
+    }
+
+    # Verify that the method is one the API uses
+    if not (isinstance(fields['method'], str) and fields['method'].upper() in batch_methods):
+
+        return None, 'Method must be one of %s' % ', '.join(batch_methods)
+
+    fields['method'] = fields['method'].upper()
+
+    # Verify that the URL is a path on this server
+    if not (isinstance(fields['url'], str) and fields['url'].startswith('/')):
+
+        return None, 'URL must be a path starting with /'
+
+    # Accept URLs taken from earlier responses, which include the application root
+    if flask.request.script_root and fields['url'].startswith(flask.request.script_root + '/'):
+
+        fields['url'] = fields['url'][len(flask.request.script_root):]
+
+    # Verify that the headers are strings
+    if not (isinstance(fields['headers'], dict) and all(isinstance(value, str) for value in fields['headers'].values())):
+
+        return None, 'Headers must be an object of strings'
+
+    return fields, None
+
+def call(fields):
+    """
+    Make an API call inside the current request, sharing its session and
+    database connection. Must be called inside the batch's transaction, so that
+    the call is made in a savepoint: a call that fails leaves no trace while the
+    others go ahead.
+
+    Parameters:
+    - fields: dictionary of validated call fields
+
+    Returns:
+    - Dictionary of the call's status, headers, and body
+    """
+
+    headers = dict(fields['headers'])
+
+    # Make the call as the logged-in user
+    if 'Cookie' in flask.request.headers:
+
+        headers['Cookie'] = flask.request.headers['Cookie']
+
+    environ = werkzeug.test.EnvironBuilder(
+        path=fields['url'],
+        base_url=flask.request.url_root,
+        method=fields['method'],
+        headers=headers,
+        json=fields['body']
+    ).get_environ()
+    environ['REMOTE_ADDR'] = flask.request.remote_addr
+
+    db = finance.model.connect()
+
+    # Accounts looked up by an earlier call may since have changed
+    flask.g.pop('accounts', None)
+
+    # The request context shares the batch's application context, and with it
+    # the database connection
+    with finance.app.request_context(environ):
+
+        if flask.request.endpoint in batch_excluded:
+
+            return {'error': 'Cannot call %s in a batch' % flask.request.path, 'status': 400}
+
+        with db.transaction():
+
+            try:
+
+                response = finance.app.full_dispatch_request()
+
+            except Exception as e:
+
+                response = finance.app.make_response(finance.app.handle_exception(e))
+
+            # Don't let a failed call roll back the calls around it
+            flask.g.pop('exception', None)
+
+            result = {
+                'status': response.status_code,
+                'headers': {key: value for key, value in response.headers.items() if key not in ['Content-Length', 'Set-Cookie']},
+                'body': (response.get_json() if response.is_json else response.get_data(as_text=True)) if response.status_code != 304 else None
+            }
+
+            # Undo whatever a failed call did
+            if response.status_code >= 400:
+
+                raise psycopg.Rollback()
+
+    return result
+
+@finance.app.route('/batch', methods = ['POST'])
+def batch():
+    """
+    Make several API calls in one request. The calls are made in order, and
+    all of them are saved together at the end.
+
+    Parameters:
+    - None
+
+    Returns:
+    - Response Object
+    """
+
+    make_response = finance.routes.response_maker(flask.url_for('batch'))
+
+    # Require the user to authenticate
+    if 'id' not in flask.session:
+
+        return make_response(data={
+            'error': 'User is not logged in'
+        }, headers={
+            'WWW-Authenticate': 'Basic realm="Finance API"'
+        }, status_code=401)
+
+    # Verify that JSON payload is present in the request
+    if flask.request.get_json(silent=True) is None:
+
+        return make_response(data={'error': 'Request does not contain JSON payload'}, status_code=400)
+
+    # Verify that the list of calls is present in JSON payload
+    if 'requests' in flask.request.json:
+
+        # And that it's a list that isn't too long
+        if isinstance(flask.request.json['requests'], list):
+
+            if len(flask.request.json['requests']) > finance.app.config['BATCH_REQUEST_LIMIT']:
+
+                return make_response(data={
+                    'error': 'Batch cannot contain more than %s requests' % finance.app.config['BATCH_REQUEST_LIMIT']
+                }, status_code=413)
+
+        else:
+
+            return make_response(data={'error': 'Requests must be a list'}, status_code=400)
+
+    else:
+
+        return make_response(data={'error': 'Missing requests'}, status_code=400)
+
+    responses = []
+
+    db = finance.model.connect()
+
+    # Make each call in turn, in one transaction (so that each call's own
+    # transaction is a savepoint within it)
+    with db.transaction():
+
+        for data in flask.request.json['requests']:
+
+            fields, error = validate(data)
+
+            responses.append({'error': error, 'status': 400} if error else call(fields))
+
+    # Return the result of every call
+    return make_response(data={'responses': responses}, status_code=200)
@@ -25,6 +25,7 @@ def index():
             'users': flask.url_for('users.index'),
             'accounts': flask.url_for('accounts.index'),
             'transactions': flask.url_for('transactions.index'),
+            'batch': flask.url_for('batch'),
             'types': {
                 'accounts': flask.url_for('accounts.types'),
                 'transactions': flask.url_for('transactions.types')
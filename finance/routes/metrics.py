@@ -0,0 +1,29 @@
+"""Metrics API controller."""
+
+import finance
+import flask
+import os
+import prometheus_client
+import prometheus_client.multiprocess
+
+@finance.app.route('/metrics', methods = ['GET'])
+def metrics():
+    """
+    Export the application's metrics in Prometheus' text format.
+
+    Parameters:
+    - None
+
+    Returns:
+    - Response Object
+    """
+
+    registry = prometheus_client.REGISTRY
+
+    # Add up the metrics of every worker process if they share a directory
+    if 'PROMETHEUS_MULTIPROC_DIR' in os.environ:
+
+        registry = prometheus_client.CollectorRegistry()
+        prometheus_client.multiprocess.MultiProcessCollector(registry)
+
+    return flask.Response(prometheus_client.generate_latest(registry), status=200, mimetype=prometheus_client.CONTENT_TYPE_LATEST)
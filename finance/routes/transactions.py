@@ -1,14 +1,28 @@
 """Transactions API controller"""
 
+import csv
 import finance
 import flask
 import datetime
+import io
 
 transaction_types = {
     0: "Transfer",
     1: "Interest"
 }
 
+export_formats = {
+    'ndjson': 'application/x-ndjson',
+    'csv': 'text/csv'
+}
+
+summary_groups = {
+    'month': "to_char(date_trunc('month', transactions.date), 'YYYY-MM-DD')",
+    'week': "to_char(date_trunc('week', transactions.date), 'YYYY-MM-DD')",
+    'type': "transactions.type",
+    'account': "legs.account"
+}
+
 blueprint = flask.Blueprint('transactions', __name__, url_prefix='/transactions')
 
 @blueprint.route('/types', methods=['GET'])
@@ -30,6 +44,344 @@ def types():
         'types': sorted([{'id': t, 'name': transaction_types[t]} for t in transaction_types], key=lambda t: t['name'])
     }, status_code=200)
 
+def validate(data):
+    """
+    Verify the fields of a new transaction. Account ownership is not checked.
+
+    Parameters:
+    - data: transaction as decoded from the JSON payload
+
+    Returns:
+    - Tuple of (dictionary of transaction fields, None) if the transaction is
+      valid, or (None, error message) if it is not
+    """
+
+    # Verify that the transaction is a JSON object
+    if not isinstance(data, dict):
+
+        return None, 'Transaction must be an object'
+
+    fields = {}
+
+    # Verify that transaction type is present
+    if 'type' in data:
+
+        # And that it's a number
+        if isinstance(data['type'], int):
+
+            if data['type'] not in transaction_types:
+
+                return None, 'Invalid transaction type'
+
+            fields['type'] = data['type']
+
+        else:
+
+            return None, 'Transaction type must be a number'
+
+    else:
+
+        return None, 'Missing transaction type'
+
+    # Verify that transaction amount is present
+    if 'amount' in data:
+
+        # And that it's a number
+        if (isinstance(data['amount'], float) or isinstance(data['amount'], int)):
+
+            # And that it's positive if this is a transfer or interest
+            if (data['type'] in [0, 1]) and not (data['amount'] > 0):
+
+                return None, 'Transaction amount must be positive'
+
+            # And that it's a whole number of cents
+            fields['amount'], error = finance.routes.to_cents(data['amount'])
+
+            if error:
+
+                return None, f'Transaction amount {error}'
+
+        else:
+
+            return None, 'Transaction amount must be a number'
+
+    else:
+
+        return None, 'Missing transaction amount'
+
+    fields['date'] = None
+
+    # Check whether transaction date is present
+    if 'date' in data:
+
+        # Verify that it's a string
+        if isinstance(data['date'], str):
+
+            try:
+
+                # Convert it to a date object
+                fields['date'] = datetime.datetime.strptime(data['date'], f'%Y-%m-%d').date()
+
+            except ValueError:
+
+                return None, 'Transaction date must be formatted as YYYY-MM-DD'
+
+        else:
+
+            return None, 'Transaction date must be a string'
+
+    # Check if this is a transfer
+    if data['type'] == 0:
+
+        # Verify that transfer source is present
+        if 'source' in data:
+
+            # And that it's an integer
+            if not isinstance(data['source'], int):
+
+                return None, 'Source account must be an integer'
+
+        else:
+
+            return None, 'Missing source account'
+
+        # Verify that transfer target is present
+        if 'target' in data:
+
+            # And that it's an integer
+            if not isinstance(data['target'], int):
+
+                return None, 'Target account must be an integer'
+
+        else:
+
+            return None, 'Missing target account'
+
+        # Verify that the target account is not the same as the source account
+        if data['target'] == data['source']:
+
+            return None, 'Target account cannot be same as source account'
+
+        fields.update({
+            'source': data['source'],
+            'target': data['target']
+        })
+
+    # Check if this is an interest transaction
+    elif data['type'] == 1:
+
+        fields['startdate'] = None
+
+        # Check whether start date is present
+        if 'startdate' in data:
+
+            # Verify that it's a string
+            if isinstance(data['startdate'], str):
+
+                try:
+
+                    # Convert it to a date object
+                    fields['startdate'] = datetime.datetime.strptime(data['startdate'], f'%Y-%m-%d').date()
+
+                except ValueError:
+
+                    return None, 'Start date must be formatted as YYYY-MM-DD'
+
+            else:
+
+                return None, 'Start date must be a string'
+
+        fields['enddate'] = None
+
+        # Check whether end date is present
+        if 'enddate' in data:
+
+            # Verify that end date was not included without start date
+            if not fields['startdate']:
+
+                return None, 'Cannot include end date without start date'
+
+            # Verify that it's a string
+            if isinstance(data['enddate'], str):
+
+                try:
+
+                    # Convert it to a date object
+                    fields['enddate'] = datetime.datetime.strptime(data['enddate'], f'%Y-%m-%d').date()
+
+                except ValueError:
+
+                    return None, 'End date must be formatted as YYYY-MM-DD'
+
+            else:
+
+                return None, 'End date must be a string'
+
+        # Verify that start date was not included without end date
+        elif fields['startdate']:
+
+            return None, 'Cannot include start date without end date'
+
+        # Verify that account is present
+        if 'account' in data:
+
+            # And that it's an integer
+            if not isinstance(data['account'], int):
+
+                return None, 'Account must be an integer'
+
+        else:
+
+            return None, 'Missing account'
+
+        fields['account'] = data['account']
+
+    return fields, None
+
+def search():
+    """
+    Build a query for the logged-in user's transactions that match the filter
+    given in the request's query string.
+
+    Parameters:
+    - None
+
+    Returns:
+    - Tuple of (query, values, None) if the filter is valid, or
+      (None, None, error message) if it is not
+    """
+
+    # Begin building the query, joining in the fields of every transaction type
+    query, values = (
+        "SELECT transactions.id, transactions.type, transactions.amount, transactions.date, "
+        "transfers.source, transfers.target, interest.account, interest.startdate, interest.enddate "
+        "FROM transactions "
+        "LEFT JOIN transfers ON transfers.id = transactions.id "
+        "LEFT JOIN interest ON interest.id = transactions.id "
+        "WHERE transactions.owner = %s"
+    ), [
+        flask.session['id']
+    ]
+
+    # Check for transaction IDs
+    if 'ids' in flask.request.args:
+
+        ids, error = finance.routes.parse_ids(flask.request.args['ids'])
+
+        if error:
+
+            return None, None, error
+
+        # Add the ID filter to the query
+        query += " AND transactions.id = ANY(%s)"
+        values.append(ids)
+
+    # Check for transaction type filter
+    if 'type' in flask.request.args:
+
+        transaction_type = flask.request.args.get('type', type=int)
+
+        # Verify that it's an integer
+        if transaction_type is None:
+
+            return None, None, 'Transaction type must be an integer'
+
+        else:
+
+            # Verify that it's a valid transaction type
+            if transaction_type in transaction_types:
+
+                # Add the type filter to the query
+                query += " AND transactions.type = %s"
+                values.append(transaction_type)
+
+            else:
+
+                return None, None, 'Invalid transaction type'
+
+    # Check for transaction date filter
+    if 'date' in flask.request.args:
+
+        transaction_date = flask.request.args.get('date', type=str)
+
+        # Verify that it's a string
+        if transaction_date is None:
+
+            return None, None, 'Transaction date must be a string'
+
+        else:
+
+            try:
+
+                # Convert it to a date object
+                transaction_date = datetime.datetime.strptime(transaction_date, f'%Y-%m-%d')
+
+                # Add the date filter to the query
+                query += " AND transactions.date = %s"
+                values.append(transaction_date)
+
+            except ValueError:
+
+                return None, None, 'Transaction date must be formatted as YYYY-MM-DD'
+
+    # Check for account ID filter
+    if 'account' in flask.request.args:
+
+        account_id = flask.request.args.get('account', type=int)
+
+        # Verify that it's an integer
+        if account_id is None:
+
+            return None, None, 'Account ID must be an integer'
+
+        else:
+
+            # Add the account ID filter to the query
+            query += " AND (transfers.source = %s OR transfers.target = %s OR interest.account = %s)"
+            values.extend([
+                account_id,
+                account_id,
+                account_id
+            ])
+
+    return query, values, None
+
+def prune(transaction):
+    """
+    Keep only the fields relevant to a transaction's type and convert its
+    amount to dollars.
+
+    Parameters:
+    - transaction: transaction with the fields of every transaction type
+
+    Returns:
+    - True if the transaction has a valid type, otherwise False
+    """
+
+    # Check if this is a transfer
+    if transaction['type'] == 0:
+
+        # Drop the interest fields
+        for key in ['account', 'startdate', 'enddate']:
+
+            del transaction[key]
+
+    # Check if this is an interest transaction
+    elif transaction['type'] == 1:
+
+        # Drop the transfer fields
+        for key in ['source', 'target']:
+
+            del transaction[key]
+
+    else:
+
+        return False
+
+    transaction['amount'] = finance.routes.from_cents(transaction['amount'])
+
+    return True
+
 @blueprint.route('', methods=['GET', 'POST'])
 def index():
     """
@@ -43,11 +395,13 @@ def index():
     """
 
     parameters = {key: flask.request.args[key] for key in flask.request.args if key in [
+        'ids',
         'type',
         'date',
         'account',
         'size',
-        'page'
+        'page',
+        'cursor'
     ]} if flask.request.method == 'GET' else {}
     make_response = finance.routes.response_maker(flask.url_for('transactions.index', **parameters))
 
@@ -63,92 +417,12 @@ def index():
     # If this is a GET request, retrieve a list of transactions
     if flask.request.method == 'GET':
 
-        # Begin building the query
-        query, values = (
-            "SELECT id, type, amount, date FROM transactions WHERE ("
-            "(SELECT owner FROM accounts WHERE accounts.id = (SELECT source FROM transfers WHERE transfers.id = transactions.id)) = %s OR "
-            "(SELECT owner FROM accounts WHERE accounts.id = (SELECT target FROM transfers WHERE transfers.id = transactions.id)) = %s OR "
-            "(SELECT owner FROM accounts WHERE accounts.id = (SELECT account FROM interest WHERE interest.id = transactions.id)) = %s)"
-        ), [
-            flask.session['id'],
-            flask.session['id'],
-            flask.session['id']
-        ]
-        
-        # Check for transaction type filter
-        if 'type' in flask.request.args:
-
-            transaction_type = flask.request.args.get('type', type=int)
-
-            # Verify that it's an integer
-            if transaction_type is None:
-
-                return make_response(data={'error': 'Transaction type must be an integer'}, status_code=400)
-
-            else:
-
-                # Verify that it's a valid transaction type
-                if transaction_type in transaction_types:
-
-                    # Add the type filter to the query
-                    query += " AND type = %s"
-                    values.append(transaction_type)
-                
-                else:
-
-                    return make_response(data={'error': 'Invalid transaction type'}, status_code=400)
-        
-        # Check for transaction date filter
-        if 'date' in flask.request.args:
-
-            transaction_date = flask.request.args.get('date', type=str)
-
-            # Verify that it's a string
-            if transaction_date is None:
-
-                return make_response(data={'error': 'Transaction date must be a string'}, status_code=400)
-            
-            else:
-
-                try:
-
-                    # Convert it to a date object
-                    transaction_date = datetime.datetime.strptime(transaction_date, f'%Y-%m-%d')
-
-                    # Add the date filter to the query
-                    query += " AND date = %s"
-                    values.append(transaction_date)
-
-                except ValueError:
-
-                    return make_response(data={'error': 'Transaction date must be formatted as YYYY-MM-DD'}, status_code=400)
-        
-        # Check for account ID filter
-        if 'account' in flask.request.args:
-
-            account_id = flask.request.args.get('account', type=int)
-
-            # Verify that it's an integer
-            if account_id is None:
-
-                return make_response(data={'error': 'Account ID must be an integer'}, status_code=400)
-            
-            else:
+        # Build the query for transactions that match the given filter
+        query, values, error = search()
 
-                # Add the account ID filter to the query
-                query += (
-                    " AND ((SELECT source FROM transfers WHERE transfers.id = transactions.id) = %s "
-                    " OR (SELECT target FROM transfers WHERE transfers.id = transactions.id) = %s"
-                    " OR (SELECT account FROM interest WHERE interest.id = transactions.id) = %s)"
-                )
-                values.extend([
-                    account_id,
-                    account_id,
-                    account_id
-                ])
+        if error:
 
-        # Sort the results by date and transaction ID
-        query += " ORDER BY date DESC, id DESC"
+            return make_response(data={'error': error}, status_code=400)
 
         page_size = 5
 
@@ -188,393 +462,433 @@ def index():
 
                     return make_response(data={'error': 'Invalid page number'}, status_code=400)
 
-        # Add the page filter to the query
-        query += " LIMIT %s OFFSET %s"
-        values.append(page_size)
-        values.append(page_number * page_size)
-        
-        # Connect to the database
-        db = finance.model.connect()
+        cursor = None
 
-        # Search the database for transactions with the given filter
-        transactions = db.execute(query + ";", values).fetchall()
+        # Check for page cursor
+        if 'cursor' in flask.request.args:
 
-        # For each transaction, fetch the data relevant to the specific transaction type
-        for transaction in transactions:
+            cursor = finance.routes.decode_cursor(flask.request.args['cursor'], 2)
 
-            # Check if this is a transfer
-            if transaction['type'] == 0:
+            try:
 
-                # Get transfer fields from database
-                transfer = db.execute("SELECT source, target FROM transfers WHERE transfers.id = %s;", [
-                    transaction['id']
-                ]).fetchone()
+                # Verify that it holds a transaction date and ID
+                if not (cursor and isinstance(cursor[0], str) and isinstance(cursor[1], int)):
 
-                # Make sure the transfer was found
-                if transfer:
+                    raise ValueError('Invalid cursor')
 
-                    # Update the transaction with transfer fields
-                    transaction.update(transfer)
-                
-                else:
+                # Convert the date to a date object
+                cursor[0] = datetime.datetime.strptime(cursor[0], f'%Y-%m-%d').date()
 
-                    return make_response(data={'error': 'Failed to retrieve transactions'}, status_code=500)
-            
-            # Check if this is an interest transaction
-            elif transaction['type'] == 1:
+            except ValueError:
+
+                return make_response(data={'error': 'Invalid cursor'}, status_code=400)
+
+            # Resume after the last transaction of the previous page
+            query += " AND (transactions.date, transactions.id) < (%s, %s)"
+            values.extend(cursor)
 
-                # Get interest fields from database
-                interest = db.execute("SELECT account, startdate, enddate FROM interest WHERE interest.id = %s;", [
-                    transaction['id']
-                ]).fetchone()
+        # Sort the results by date and transaction ID
+        query += " ORDER BY transactions.date DESC, transactions.id DESC"
 
-                # Make sure the interest entry was found
-                if interest:
+        # Add the page filter to the query (page numbers are only honored without a cursor,
+        # and transactions asked for by ID all come back at once)
+        if 'ids' not in flask.request.args:
 
-                    # Format the start and end dates
-                    if interest['startdate'] and interest['enddate']:
+            query += " LIMIT %s OFFSET %s"
+            values.append(page_size)
+            values.append(0 if cursor else page_number * page_size)
+        
+        # Connect to the database
+        db = finance.model.connect()
 
-                        interest.update({
-                            'startdate': interest['startdate'].strftime(f'%Y-%m-%d'),
-                            'enddate': interest['enddate'].strftime(f'%Y-%m-%d')
-                        })
+        tag = finance.routes.entity_tag(db)
 
-                    # Update the transaction with interest fields
-                    transaction.update(interest)
-                
-                else:
+        # Skip the search if the client already has the latest list of transactions
+        if flask.request.if_none_match.contains(tag):
 
-                    return make_response(data={'error': 'Failed to retrieve transactions'}, status_code=500)
-            
-            else:
+            return finance.routes.not_modified(tag)
+
+        # Search the database for transactions with the given filter
+        transactions = db.execute(query + ";", values).fetchall()
+
+        # Format each transaction before returning the response
+        for transaction in transactions:
+
+            # Keep only the fields relevant to the specific transaction type
+            if not prune(transaction):
 
                 return make_response(data={'error': 'Encountered invalid transaction type'}, status_code=500)
+
+            # Include the transaction's URL in the response
+            transaction['url'] = flask.url_for('transactions.detail', id=transaction['id'])
         
-            # Format the date and include the transaction's URL in the response
-            transaction.update({
-                'date': transaction['date'].strftime(f'%Y-%m-%d'),
-                'url': flask.url_for('transactions.detail', id=transaction['id'])
-            })
-        
-        # Adjust the parameters for the next page
-        parameters['page'] = page_number + 1
+        # Adjust the parameters for the next page, if there might be one
+        parameters.pop('page', None)
+        parameters['cursor'] = finance.routes.encode_cursor([
+            transactions[-1]['date'].isoformat(),
+            transactions[-1]['id']
+        ]) if 'ids' not in flask.request.args and page_size and len(transactions) == page_size else None
         
         # Return the list of transactions with the URL for the next page
         return make_response(data={
             'transactions': transactions,
-            'next': flask.url_for('transactions.index', **parameters)
-        }, status_code=200)
+            'next': flask.url_for('transactions.index', **parameters) if parameters['cursor'] else None
+        }, headers=finance.routes.tag_headers(tag), status_code=200)
     
     # If this is a POST request, create a new transaction
     elif flask.request.method == 'POST':
 
         # Verify that JSON payload is present in the request
-        if flask.request.json is None:
+        if flask.request.get_json(silent=True) is None:
 
             return make_response(data={'error': 'Request does not contain JSON payload'}, status_code=400)
-        
-        # Verify that transaction type is present in JSON payload
-        if 'type' in flask.request.json:
 
-            # And that it's a number
-            if isinstance(flask.request.json['type'], int):
+        # Verify the transaction fields
+        fields, error = validate(flask.request.json)
 
-                if flask.request.json['type'] not in transaction_types:
+        if error:
 
-                    return make_response(data={'error': 'Invalid transaction type'}, status_code=400)
+            return make_response(data={'error': error}, status_code=400)
 
-            else:
+        # Connect to the database
+        db = finance.model.connect()
 
-                return make_response(data={'error': 'Transaction type must be a number'}, status_code=400)
-        
-        else:
+        # Check if this is a transfer
+        if fields['type'] == 0:
+
+            # Move the money between the accounts
+            transaction, error = finance.ledger.transfer(db, flask.session['id'], fields)
 
-            return make_response(data={'error': 'Missing transaction type'}, status_code=400)
+        # Check if this is an interest transaction
+        elif fields['type'] == 1:
 
-        # Verify that transaction amount is present in JSON payload
-        if 'amount' in flask.request.json:
+            # Add the interest to the account
+            transaction, error = finance.ledger.interest(db, flask.session['id'], fields)
 
-            # And that it's a number
-            if (isinstance(flask.request.json['amount'], float) or isinstance(flask.request.json['amount'], int)):
+        # Verify that the accounts exist (and belong to the user)
+        if error:
 
-                # And that it's positive if this is a transfer or interest
-                if (flask.request.json['type'] in [0, 1]) and not (flask.request.json['amount'] > 0):
+            return make_response(data={'error': error}, status_code=400)
 
-                    return make_response(data={'error': 'Transaction amount must be positive'}, status_code=400)
-            
-            else:
+        # Include transaction's amount in dollars and URL in response
+        transaction.update({
+            'amount': finance.routes.from_cents(transaction['amount']),
+            'url': flask.url_for('transactions.detail', id=transaction['id'])
+        })
+
+        # Return the transaction
+        return make_response(data={'transaction': transaction}, status_code=201)
+
+@blueprint.route('/batch', methods=['POST'])
+def batch():
+    """
+    Create many transactions at once.
+
+    Parameters:
+    - None
+
+    Returns:
+    - Response Object
+    """
+
+    make_response = finance.routes.response_maker(flask.url_for('transactions.batch'))
+
+    # Require the user to authenticate
+    if 'id' not in flask.session:
+
+        return make_response(data={
+            'error': 'User is not logged in'
+        }, headers={
+            'WWW-Authenticate': 'Basic realm="Finance API"'
+        }, status_code=401)
+
+    # Verify that JSON payload is present in the request
+    if flask.request.get_json(silent=True) is None:
 
-                return make_response(data={'error': 'Transaction amount must be a number'}, status_code=400)
+        return make_response(data={'error': 'Request does not contain JSON payload'}, status_code=400)
+
+    # Verify that the list of transactions is present in JSON payload
+    if 'transactions' in flask.request.json:
+
+        # And that it's a list that isn't too long
+        if isinstance(flask.request.json['transactions'], list):
+
+            if len(flask.request.json['transactions']) > finance.app.config['TRANSACTION_BATCH_LIMIT']:
+
+                return make_response(data={
+                    'error': 'Batch cannot contain more than %s transactions' % finance.app.config['TRANSACTION_BATCH_LIMIT']
+                }, status_code=413)
 
         else:
 
-            return make_response(data={'error': 'Missing transaction amount'}, status_code=400)
+            return make_response(data={'error': 'Transactions must be a list'}, status_code=400)
 
-        date = None
+    else:
 
-        # Check whether transaction date is present in JSON payload
-        if 'date' in flask.request.json:
+        return make_response(data={'error': 'Missing transactions'}, status_code=400)
 
-            # Verify that it's a string
-            if isinstance(flask.request.json['date'], str):
+    results = [None] * len(flask.request.json['transactions'])
+    pending = []
 
-                try:
+    # Verify the fields of every transaction
+    for index, data in enumerate(flask.request.json['transactions']):
 
-                    # Convert it to a date object
-                    date = datetime.datetime.strptime(flask.request.json['date'], f'%Y-%m-%d')
+        fields, error = validate(data)
 
-                except ValueError:
+        if error:
 
-                    return make_response(data={'error': 'Transaction date must be formatted as YYYY-MM-DD'}, status_code=400)
-                
-            else:
+            results[index] = {'error': error, 'status': 400}
 
-                return make_response(data={'Transaction date must be a string'}, status_code=400)
+        else:
 
-        # Check if this is a transfer
-        if flask.request.json['type'] == 0:
+            pending.append((index, fields))
 
-            source = None
-            target = None
+    # Connect to the database
+    db = finance.model.connect()
+
+    def work():
+        """
+        Write every valid transaction and adjust account balances.
+
+        Parameters:
+        - None
+
+        Returns:
+        - None
+        """
 
-            # Connect to the database
-            db = finance.model.connect()
+        # Find out which of the referenced accounts belong to the user and lock them, all at once
+        owned = finance.ledger.lock(db, flask.session['id'], [fields[key] for index, fields in pending for key in ['source', 'target', 'account'] if key in fields])
 
-            # Verify that transfer source is present in JSON payload
-            if 'source' in flask.request.json:
+        valid = []
 
-                # And that it's an integer
-                if isinstance(flask.request.json['source'], int):
+        # Verify that every transaction only touches the user's own accounts
+        for index, fields in pending:
 
-                    # Search for the transfer source account
-                    source = db.execute('SELECT balance FROM accounts WHERE id = %s AND owner = %s;', [
-                        flask.request.json['source'],
-                        flask.session['id']
-                    ]).fetchone()
+            if fields['type'] == 0 and fields['source'] not in owned:
 
-                    # Verify that the account exists (and belongs to the user)
-                    if not source:
+                results[index] = {'error': 'Source account does not exist', 'status': 400}
 
-                        return make_response(data={'error': 'Source account does not exist'}, status_code=400)
+            elif fields['type'] == 0 and fields['target'] not in owned:
 
-                else:
+                results[index] = {'error': 'Target account does not exist', 'status': 400}
 
-                    return make_response(data={'error': 'Source account must be an integer'}, status_code=400)
+            elif fields['type'] == 1 and fields['account'] not in owned:
+
+                results[index] = {'error': 'Account does not exist', 'status': 400}
 
             else:
 
-                return make_response(data={'error': 'Missing source account'}, status_code=400)
+                valid.append((index, fields))
 
-            # Verify that transfer target is present in JSON payload
-            if 'target' in flask.request.json:
+        if valid:
 
-                # And that it's an integer
-                if isinstance(flask.request.json['target'], int):
+            # Reserve an identifier for every new transaction
+            ids = [row['id'] for row in db.execute("SELECT nextval(pg_get_serial_sequence('transactions', 'id')) AS id FROM generate_series(1, %s);", [
+                len(valid)
+            ]).fetchall()]
 
-                    # Search for the transfer target account
-                    target = db.execute('SELECT balance FROM accounts WHERE id = %s AND owner = %s;', [
-                        flask.request.json['target'],
-                        flask.session['id']
-                    ]).fetchone()
+            # Create the transactions
+            dates = {row['id']: row['date'] for row in db.execute(
+                "INSERT INTO transactions (id, owner, type, amount, date) "
+                "SELECT id, %s, type, amount, COALESCE(date, CURRENT_DATE) "
+                "FROM unnest(%s::bigint[], %s::smallint[], %s::bigint[], %s::date[]) AS batch (id, type, amount, date) "
+                "RETURNING id, date;", [
+                flask.session['id'],
+                ids,
+                [fields['type'] for index, fields in valid],
+                [fields['amount'] for index, fields in valid],
+                [fields['date'] for index, fields in valid]
+            ]).fetchall()}
+
+            transfers = [(id, fields) for id, (index, fields) in zip(ids, valid) if fields['type'] == 0]
+            interest = [(id, fields) for id, (index, fields) in zip(ids, valid) if fields['type'] == 1]
+
+            # Create the transfers
+            if transfers:
+
+                db.execute(
+                    "INSERT INTO transfers (id, source, target) "
+                    "SELECT * FROM unnest(%s::bigint[], %s::bigint[], %s::bigint[]);", [
+                    [id for id, fields in transfers],
+                    [fields['source'] for id, fields in transfers],
+                    [fields['target'] for id, fields in transfers]
+                ])
 
-                    # Verify that the account exists (and belongs to the user)
-                    if target:
+            # Create the interest entries
+            if interest:
 
-                        # Verify that the target account is not the same as the source account
-                        if flask.request.json['target'] == flask.request.json['source']:
+                db.execute(
+                    "INSERT INTO interest (id, account, startdate, enddate) "
+                    "SELECT * FROM unnest(%s::bigint[], %s::bigint[], %s::date[], %s::date[]);", [
+                    [id for id, fields in interest],
+                    [fields['account'] for id, fields in interest],
+                    [fields['startdate'] for id, fields in interest],
+                    [fields['enddate'] for id, fields in interest]
+                ])
 
-                            return make_response(data={'error': 'Target account cannot be same as source account'}, status_code=400)
+            legs = {}
+            deltas = {}
 
-                    else:
+            # Add up the net change in balance of each account, in total and on each day
+            for id, (index, fields) in zip(ids, valid):
 
-                        return make_response(data={'error': 'Target account does not exist'}, status_code=400)
+                if fields['type'] == 0:
 
-                else:
+                    changes = [(fields['source'], -fields['amount']), (fields['target'], fields['amount'])]
 
-                    return make_response(data={'error': 'Target account must be an integer'}, status_code=400)
+                elif fields['type'] == 1:
 
-            else:
+                    changes = [(fields['account'], fields['amount'])]
 
-                return make_response(data={'error': 'Missing target account'}, status_code=400)
+                for account, delta in changes:
 
-            # Adjust the balance of the source account
-            db.execute("UPDATE accounts SET balance = %s WHERE id = %s;", [
-                source['balance'] - flask.request.json['amount'],
-                flask.request.json['source']
-            ])
+                    legs[(account, dates[id])] = legs.get((account, dates[id]), 0) + delta
+                    deltas[account] = deltas.get(account, 0) + delta
 
-            # Adjust the balance of the target account
-            db.execute("UPDATE accounts SET balance = %s WHERE id = %s;", [
-                target['balance'] + flask.request.json['amount'],
-                flask.request.json['target']
-            ])
+            # Adjust the balance of each account once, keeping a history of its balance
+            finance.ledger.record(db, [(account, date, delta) for (account, date), delta in legs.items()])
+            finance.ledger.adjust(db, deltas)
 
-            # Create the transaction
-            transaction = db.execute("INSERT INTO transactions (type, amount, date) VALUES (%s, %s, %s) RETURNING id, type, amount, date;", [
-                flask.request.json['type'],
-                flask.request.json['amount'],
-                date
-            ]).fetchone() if 'date' in flask.request.json else db.execute("INSERT INTO transactions (type, amount) VALUES (%s, %s) RETURNING id, type, amount, date;", [
-                flask.request.json['type'],
-                flask.request.json['amount'],
-            ]).fetchone()
-
-            # Create the transfer
-            transfer = db.execute("INSERT INTO transfers (id, source, target) VALUES (%s, %s, %s) RETURNING source, target;", [
-                transaction['id'],
-                flask.request.json['source'],
-                flask.request.json['target']
-            ]).fetchone()
-
-            # Include transfer fields in response
-            transaction.update(transfer)
-
-            # Format the date and include transaction's URL in response
-            transaction.update({
-                'date': transaction['date'].strftime(f'%Y-%m-%d'),
-                'url': flask.url_for('transactions.detail', id=transaction['id'])
-            })
+            # Invalidate anything cached from the user's ledger
+            finance.cache.bump(db, flask.session['id'])
 
-            # Return the transaction
-            return make_response(data={'transaction': transaction}, status_code=201)
-        
-        # Check if this is an interest transaction
-        if flask.request.json['type'] == 1:
+            # Report each new transaction
+            for id, (index, fields) in zip(ids, valid):
 
-            startdate = None
+                transaction = {
+                    'id': id,
+                    'type': fields['type'],
+                    'amount': finance.routes.from_cents(fields['amount']),
+                    'date': dates[id]
+                }
 
-            # Check whether start date is present in JSON payload
-            if 'startdate' in flask.request.json:
+                # Include the fields specific to the transaction type
+                if fields['type'] == 0:
 
-                # Verify that it's a string
-                if isinstance(flask.request.json['startdate'], str):
+                    transaction.update({
+                        'source': fields['source'],
+                        'target': fields['target']
+                    })
 
-                    try:
+                elif fields['type'] == 1:
 
-                        # Convert it to a date object
-                        startdate = datetime.datetime.strptime(flask.request.json['startdate'], f'%Y-%m-%d')
+                    transaction.update({
+                        'account': fields['account'],
+                        'startdate': fields['startdate'],
+                        'enddate': fields['enddate']
+                    })
 
-                    except ValueError:
+                transaction['url'] = flask.url_for('transactions.detail', id=id)
 
-                        return make_response(data={'error': 'Start date must be formatted as YYYY-MM-DD'}, status_code=400)
+                results[index] = {'transaction': transaction, 'status': 201}
 
-                else:
+    finance.ledger.retry(db, work)
 
-                    return make_response(data={'Start date must be a string'}, status_code=400)
-            
-            enddate = None
+    # Return the result of each transaction in the order they were given
+    return make_response(data={'results': results}, status_code=200)
 
-            # Check whether end date is present in JSON payload
-            if 'enddate' in flask.request.json:
+@blueprint.route('/export', methods=['GET'])
+def export():
+    """
+    Stream every transaction that matches a filter as NDJSON or CSV.
 
-                # Verify that end date was not included without start date
-                if not startdate:
+    Parameters:
+    - None
 
-                    return make_response(data={'error': 'Cannot include end date without start date'}, status_code=400)
+    Returns:
+    - Response Object
+    """
 
-                # Verify that it's a string
-                if isinstance(flask.request.json['enddate'], str):
+    parameters = {key: flask.request.args[key] for key in flask.request.args if key in [
+        'ids',
+        'type',
+        'date',
+        'account',
+        'format'
+    ]}
+    make_response = finance.routes.response_maker(flask.url_for('transactions.export', **parameters))
 
-                    try:
+    # Require the user to authenticate
+    if 'id' not in flask.session:
 
-                        # Convert it to a date object
-                        enddate = datetime.datetime.strptime(flask.request.json['enddate'], f'%Y-%m-%d')
+        return make_response(data={
+            'error': 'User is not logged in'
+        }, headers={
+            'WWW-Authenticate': 'Basic realm="Finance API"'
+        }, status_code=401)
 
-                    except ValueError:
+    export_format = flask.request.args.get('format', 'ndjson')
 
-                        return make_response(data={'error': 'End date must be formatted as YYYY-MM-DD'}, status_code=400)
-                    
-                else:
+    # Verify that it's a format we can export
+    if export_format not in export_formats:
 
-                    return make_response(data={'End date must be a string'}, status_code=400)
-            
-            else:
+        return make_response(data={'error': 'Export format must be one of %s' % ', '.join(export_formats)}, status_code=400)
 
-                # Verify that start date was not included without end date
-                if startdate:
+    # Build the query for transactions that match the given filter
+    query, values, error = search()
 
-                    return make_response(data={'error': 'Cannot include start date without end date'})
+    if error:
 
-            # Connect to the database
-            db = finance.model.connect()
+        return make_response(data={'error': error}, status_code=400)
 
-            # Verify that account is present in JSON payload
-            if 'account' in flask.request.json:
+    # Sort the results by date and transaction ID
+    query += " ORDER BY transactions.date DESC, transactions.id DESC"
 
-                # And that it's an integer
-                if isinstance(flask.request.json['account'], int):
+    # Connect to the database
+    db = finance.model.connect()
 
-                    # Search for the account
-                    account = db.execute('SELECT balance FROM accounts WHERE id = %s AND owner = %s;', [
-                        flask.request.json['account'],
-                        flask.session['id']
-                    ]).fetchone()
+    def generate():
+        """
+        Fetch transactions a few at a time from a server-side cursor and
+        format each one as it arrives.
 
-                    # Verify that the account exists (and belongs to the user)
-                    if not account:
+        Parameters:
+        - None
 
-                        return make_response(data={'error': 'Account does not exist'}, status_code=400)
+        Returns:
+        - Generator of response body chunks
+        """
 
-                else:
+        with db.cursor(name='export') as cursor:
 
-                    return make_response(data={'error': 'Account must be an integer'}, status_code=400)
+            cursor.itersize = 1000
+            cursor.execute(query + ";", values)
 
-            else:
+            if export_format == 'csv':
 
-                return make_response(data={'error': 'Missing account'}, status_code=400)
+                buffer = io.StringIO()
+                writer = csv.writer(buffer)
 
-            # Adjust the balance of the account
-            db.execute("UPDATE accounts SET balance = %s WHERE id = %s;", [
-                account['balance'] + flask.request.json['amount'],
-                flask.request.json['account']
-            ])
+                # Start with a header naming every column
+                writer.writerow([column.name for column in cursor.description])
 
-            # Create the transaction
-            transaction = db.execute("INSERT INTO transactions (type, amount, date) VALUES (%s, %s, %s) RETURNING id, type, amount, date;", [
-                flask.request.json['type'],
-                flask.request.json['amount'],
-                date
-            ]).fetchone() if 'date' in flask.request.json else db.execute("INSERT INTO transactions (type, amount) VALUES (%s, %s) RETURNING id, type, amount, date;", [
-                flask.request.json['type'],
-                flask.request.json['amount'],
-            ]).fetchone()
-
-            # Create the interest entry
-            interest = db.execute("INSERT INTO interest (id, account, startdate, enddate) VALUES (%s, %s, %s, %s) RETURNING account, startdate, enddate;", [
-                transaction['id'],
-                flask.request.json['account'],
-                flask.request.json['startdate'],
-                flask.request.json['enddate']
-            ]).fetchone() if startdate and enddate else db.execute("INSERT INTO interest (id, account) VALUES (%s, %s) RETURNING account, startdate, enddate;", [
-                transaction['id'],
-                flask.request.json['account'],
-            ]).fetchone()
-
-            # Include interest fields in response
-            transaction.update(interest)
-
-            # Format the start and end dates
-            if transaction['startdate'] and transaction['enddate']:
-
-                transaction.update({
-                    'startdate': transaction['startdate'].strftime(f'%Y-%m-%d'),
-                    'enddate': transaction['enddate'].strftime(f'%Y-%m-%d')
-                })
-
-            # Format the date and include transaction's URL in response
-            transaction.update({
-                'date': transaction['date'].strftime(f'%Y-%m-%d'),
-                'url': flask.url_for('transactions.detail', id=transaction['id'])
-            })
+                for transaction in cursor:
 
-            # Return the transaction
-            return make_response(data={'transaction': transaction}, status_code=201)
+                    transaction['amount'] = finance.routes.from_cents(transaction['amount'])
+                    writer.writerow(transaction.values())
 
-@blueprint.route('/<int:id>', methods=['GET'])
-def detail(id):
+                    yield buffer.getvalue()
+                    buffer.seek(0)
+                    buffer.truncate()
+
+            else:
+
+                for transaction in cursor:
+
+                    prune(transaction)
+                    yield flask.json.dumps(transaction) + '\n'
+
+    # Start sending transactions before the query finishes
+    return flask.Response(flask.stream_with_context(generate()), status=200, mimetype=export_formats[export_format], headers={
+        'Content-Disposition': 'attachment; filename=transactions.%s' % export_format
+    })
+
+@blueprint.route('/summary', methods=['GET'])
+def summary():
     """
-    Show a transaction.
-    
+    Add up the money flowing into and out of the logged-in user's accounts.
+
     Parameters:
     - None
 
@@ -582,7 +896,12 @@ def detail(id):
     - Response Object
     """
 
-    make_response = finance.routes.response_maker(flask.url_for('transactions.detail', id=id))
+    parameters = {key: flask.request.args[key] for key in flask.request.args if key in [
+        'group',
+        'from',
+        'to'
+    ]}
+    make_response = finance.routes.response_maker(flask.url_for('transactions.summary', **parameters))
 
     # Require the user to authenticate
     if 'id' not in flask.session:
@@ -593,77 +912,145 @@ def detail(id):
             'WWW-Authenticate': 'Basic realm="Finance API"'
         }, status_code=401)
 
+    group = flask.request.args.get('group', 'month')
+
+    # Verify that it's something we can group by
+    if group not in summary_groups:
+
+        return make_response(data={'error': 'Group must be one of %s' % ', '.join(summary_groups)}, status_code=400)
+
+    start = None
+
+    # Check for start date
+    if 'from' in flask.request.args:
+
+        try:
+
+            # Convert it to a date object
+            start = datetime.datetime.strptime(flask.request.args['from'], f'%Y-%m-%d').date()
+
+        except ValueError:
+
+            return make_response(data={'error': 'Start date must be formatted as YYYY-MM-DD'}, status_code=400)
+
+    end = None
+
+    # Check for end date
+    if 'to' in flask.request.args:
+
+        try:
+
+            # Convert it to a date object
+            end = datetime.datetime.strptime(flask.request.args['to'], f'%Y-%m-%d').date()
+
+        except ValueError:
+
+            return make_response(data={'error': 'End date must be formatted as YYYY-MM-DD'}, status_code=400)
+
+    # Verify that the start date isn't after the end date
+    if start and end and start > end:
+
+        return make_response(data={'error': 'Start date cannot be after end date'}, status_code=400)
+
     # Connect to the database
     db = finance.model.connect()
 
-    # Search for a transaction with the specified ID
-    transaction = db.execute(
-        "SELECT id, type, amount, date FROM transactions WHERE transactions.id = %s;", [
-        id
-    ]).fetchone()
+    # Reuse the summary if the user's ledger hasn't changed since it was computed
+    key = ('summary', flask.session['id'], finance.cache.version(db, flask.session['id']), group, start, end)
+    totals = finance.cache.get(key)
 
-    # Make sure the transaction exists
-    if transaction:
+    if totals is None:
 
-        # Check if this is a transfer
-        if transaction['type'] == 0:
+        # Split each transaction into the change it makes to each account's balance
+        query, values = (
+            "SELECT " + summary_groups[group] + " AS " + group + ", "
+            "COALESCE(SUM(legs.delta) FILTER (WHERE legs.delta > 0), 0)::bigint AS inflow, "
+            "COALESCE(-SUM(legs.delta) FILTER (WHERE legs.delta < 0), 0)::bigint AS outflow, "
+            "SUM(legs.delta)::bigint AS net "
+            "FROM transactions "
+            "LEFT JOIN transfers ON transfers.id = transactions.id "
+            "LEFT JOIN interest ON interest.id = transactions.id "
+            "CROSS JOIN LATERAL (VALUES "
+            "(transfers.source, -transactions.amount), "
+            "(transfers.target, transactions.amount), "
+            "(interest.account, transactions.amount)) AS legs (account, delta) "
+            "WHERE transactions.owner = %s AND legs.account IS NOT NULL"
+        ), [
+            flask.session['id']
+        ]
 
-            # Search the database for a transfer with the specified ID and owned by the logged-in user
-            transfer = db.execute("SELECT source, target FROM transfers WHERE id = %s "
-            "AND (SELECT owner FROM accounts WHERE accounts.id = transfers.source) = %s "
-            "AND (SELECT owner FROM accounts WHERE accounts.id = transfers.target) = %s;", [
-                id,
-                flask.session['id'],
-                flask.session['id']
-            ]).fetchone()
+        # Add the date filters to the query
+        if start:
 
-            # Make sure the transfer was found
-            if transfer:
+            query += " AND transactions.date >= %s"
+            values.append(start)
 
-                # Include transfer fields in response
-                transaction.update(transfer)
+        if end:
 
-            else:
+            query += " AND transactions.date <= %s"
+            values.append(end)
 
-                return make_response(data={'error': 'Transaction not found'}, status_code=404)
+        # Add up the changes in each group
+        query += " GROUP BY 1 ORDER BY 1"
 
-        # Check if this is an interest transaction
-        elif transaction['type'] == 1:
+        totals = db.execute(query + ";", values).fetchall()
 
-            # Search the database for an interest entry with the specified ID and owned by the logged-in user
-            interest = db.execute("SELECT account, startdate, enddate FROM interest WHERE id = %s "
-            "AND (SELECT owner FROM accounts WHERE accounts.id = interest.account) = %s;", [
-                id,
-                flask.session['id']
-            ]).fetchone()
+        # Convert the totals to dollars once, before caching them
+        for total in totals:
 
-            # Make sure the interest entry was found
-            if interest:
+            total.update({
+                'inflow': finance.routes.from_cents(total['inflow']),
+                'outflow': finance.routes.from_cents(total['outflow']),
+                'net': finance.routes.from_cents(total['net'])
+            })
 
-                # Include interest fields in response
-                transaction.update(interest)
+        finance.cache.put(key, totals)
 
-                # Format the start and end dates
-                if transaction['startdate'] and transaction['enddate']:
+    # Return the totals
+    return make_response(data={'summary': totals}, status_code=200)
 
-                    transaction.update({
-                        'startdate': transaction['startdate'].strftime(f'%Y-%m-%d'),
-                        'enddate': transaction['enddate'].strftime(f'%Y-%m-%d')
-                    })
+@blueprint.route('/<int:id>', methods=['GET'])
+def detail(id):
+    """
+    Show a transaction.
+    
+    Parameters:
+    - None
 
-            else:
+    Returns:
+    - Response Object
+    """
 
-                return make_response(data={'error': 'Transaction not found'}, status_code=404)
-            
-        else:
+    make_response = finance.routes.response_maker(flask.url_for('transactions.detail', id=id))
+
+    # Require the user to authenticate
+    if 'id' not in flask.session:
+
+        return make_response(data={
+            'error': 'User is not logged in'
+        }, headers={
+            'WWW-Authenticate': 'Basic realm="Finance API"'
+        }, status_code=401)
+
+    # Connect to the database
+    db = finance.model.connect()
+
+    # Search for a transaction with the specified ID owned by the logged-in user
+    transaction = finance.model.query(db, 'transaction', [
+        id,
+        flask.session['id']
+    ]).fetchone()
+
+    # Make sure the transaction exists
+    if transaction:
+
+        # Keep only the fields relevant to the specific transaction type
+        if not prune(transaction):
 
             return make_response(data={'error': 'Invalid transaction type'}, status_code=500)
-        
-        # Format the date and include transaction's URL in response
-        transaction.update({
-            'date': transaction['date'].strftime(f'%Y-%m-%d'),
-            'url': flask.url_for('transactions.detail', id=transaction['id'])
-        })
+
+        # Include transaction's URL in response
+        transaction['url'] = flask.url_for('transactions.detail', id=transaction['id'])
 
         # Return the transaction
         return make_response(data={'transaction': transaction}, status_code=200)
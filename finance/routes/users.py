@@ -2,7 +2,6 @@
 
 import finance
 import flask
-import bcrypt
 import re
 
 blueprint = flask.Blueprint('users', __name__, url_prefix='/users')
@@ -27,9 +26,9 @@ def index():
         return make_response(data={'error': 'User is already logged in'}, status_code=403)
 
     # Verify that JSON payload is present in the request
-    if not flask.request.json:
+    if not flask.request.get_json(silent=True):
 
-        return make_response(data={'Request does not contain JSON payload'}, status_code=400)
+        return make_response(data={'error': 'Request does not contain JSON payload'}, status_code=400)
 
     # Verify that name is present in JSON payload
     if 'name' in flask.request.json:
@@ -83,16 +82,19 @@ def index():
         # And that it's a string with the right length
         if not (isinstance(flask.request.json['password'], str) and (8 <= len(flask.request.json['password'])) and (len(flask.request.json['password']) <= 72)):
 
-            return make_response(data={'Password must be a string containing 8-72 characters'}, status_code=400)
+            return make_response(data={'error': 'Password must be a string containing 8-72 characters'}, status_code=400)
 
     else:
 
         return make_response(data={'error': 'Missing password'}, status_code=400)
 
-    # Generate a random salt
-    salt = bcrypt.gensalt()
     # Hash the new user's password
-    hash = bcrypt.hashpw(flask.request.json['password'].encode(), salt)
+    hash, error = finance.passwords.hash(flask.request.json['password'])
+
+    # Ask the client to try again later if the server is too busy to hash it
+    if error:
+
+        return make_response(data={'error': error}, headers={'Retry-After': '1'}, status_code=503)
 
     # Connect to the database
     db = finance.model.connect()
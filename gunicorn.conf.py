@@ -0,0 +1,61 @@
+"""Gunicorn configuration."""
+
+import os
+import prometheus_client.multiprocess
+import shutil
+import sys
+
+def on_starting(server):
+    """
+    Start each run with an empty directory for the workers' metrics.
+
+    Parameters:
+    - server: Gunicorn arbiter
+
+    Returns:
+    - None
+    """
+
+    if 'PROMETHEUS_MULTIPROC_DIR' in os.environ:
+
+        shutil.rmtree(os.environ['PROMETHEUS_MULTIPROC_DIR'], ignore_errors=True)
+        os.makedirs(os.environ['PROMETHEUS_MULTIPROC_DIR'])
+
+def post_fork(server, worker):
+    """
+    Give each worker a database connection for every request thread it runs
+    (see --threads), unless DB_POOL_MAX_SIZE says otherwise.
+
+    Parameters:
+    - server: Gunicorn arbiter
+    - worker: worker that was just started
+
+    Returns:
+    - None
+    """
+
+    if server.cfg.threads > 1 and 'DB_POOL_MAX_SIZE' not in os.environ:
+
+        os.environ['DB_POOL_MAX_SIZE'] = str(server.cfg.threads)
+
+        # With --preload, the application has already read its configuration
+        # (but hasn't opened its pools, which happens on first use)
+        if 'finance' in sys.modules:
+
+            sys.modules['finance'].app.config['DB_POOL_MAX_SIZE'] = server.cfg.threads
+
+def child_exit(server, worker):
+    """
+    Stop counting a worker's gauges once it exits.
+
+    Parameters:
+    - server: Gunicorn arbiter
+    - worker: worker that exited
+
+    Returns:
+    - None
+    """
+
+    if 'PROMETHEUS_MULTIPROC_DIR' in os.environ:
+
+        prometheus_client.multiprocess.mark_process_dead(worker.pid)
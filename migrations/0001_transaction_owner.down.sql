@@ -0,0 +1,7 @@
+DROP INDEX interest_account;
+DROP INDEX transfers_target;
+DROP INDEX transfers_source;
+DROP INDEX transactions_owner_type_date_id;
+DROP INDEX transactions_owner_date_id;
+
+ALTER TABLE transactions DROP COLUMN owner;
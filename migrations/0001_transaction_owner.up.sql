@@ -0,0 +1,21 @@
+ALTER TABLE transactions ADD COLUMN owner BIGINT;
+
+UPDATE transactions SET owner = accounts.owner
+FROM transfers JOIN accounts ON accounts.id = transfers.source
+WHERE transfers.id = transactions.id;
+
+UPDATE transactions SET owner = accounts.owner
+FROM interest JOIN accounts ON accounts.id = interest.account
+WHERE interest.id = transactions.id;
+
+-- Transactions left behind by deleted accounts no longer belong to anyone
+DELETE FROM transactions WHERE owner IS NULL;
+
+ALTER TABLE transactions ALTER COLUMN owner SET NOT NULL;
+ALTER TABLE transactions ADD FOREIGN KEY(owner) REFERENCES users(id) ON UPDATE CASCADE ON DELETE CASCADE;
+
+CREATE INDEX transactions_owner_date_id ON transactions (owner, date DESC, id DESC);
+CREATE INDEX transactions_owner_type_date_id ON transactions (owner, type, date DESC, id DESC);
+CREATE INDEX transfers_source ON transfers (source);
+CREATE INDEX transfers_target ON transfers (target);
+CREATE INDEX interest_account ON interest (account);
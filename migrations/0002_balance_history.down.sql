@@ -0,0 +1,3 @@
+DROP FUNCTION record_balances(BIGINT[], DATE[], DECIMAL[]);
+
+DROP TABLE balances;
@@ -0,0 +1,65 @@
+CREATE TABLE balances (
+    account BIGINT NOT NULL,
+    date DATE NOT NULL,
+    delta DECIMAL NOT NULL DEFAULT 0,
+    balance DECIMAL NOT NULL,
+    FOREIGN KEY(account) REFERENCES accounts(id) ON UPDATE CASCADE ON DELETE CASCADE,
+    PRIMARY KEY(account, date)
+);
+
+-- Replay the existing ledger into one row per account per day, working back
+-- from each account's current balance (through DOUBLE PRECISION, since casting
+-- REAL straight to DECIMAL keeps only 6 significant digits)
+INSERT INTO balances (account, date, delta, balance)
+SELECT days.account, days.date, days.delta,
+    round(accounts.balance::DOUBLE PRECISION::NUMERIC, 2)
+    - SUM(days.delta) OVER (PARTITION BY days.account)
+    + SUM(days.delta) OVER (PARTITION BY days.account ORDER BY days.date)
+FROM (
+    SELECT legs.account, legs.date, SUM(legs.delta) AS delta FROM (
+        SELECT transfers.source AS account, transactions.date, -transactions.amount AS delta
+        FROM transactions JOIN transfers ON transfers.id = transactions.id
+        UNION ALL
+        SELECT transfers.target, transactions.date, transactions.amount
+        FROM transactions JOIN transfers ON transfers.id = transactions.id
+        UNION ALL
+        SELECT interest.account, transactions.date, transactions.amount
+        FROM transactions JOIN interest ON interest.id = transactions.id
+    ) AS legs
+    GROUP BY legs.account, legs.date
+) AS days
+JOIN accounts ON accounts.id = days.account;
+
+-- Record changes in balance on the given days. Must be called before the
+-- changes are applied to accounts.balance.
+CREATE FUNCTION record_balances(account_ids BIGINT[], days DATE[], amounts DECIMAL[]) RETURNS VOID AS $$
+    -- Start a row for each day that doesn't have one yet, carrying the balance
+    -- forward from the day before (or from the account's REAL balance, as an
+    -- exact NUMERIC so that the whole COALESCE isn't narrowed to REAL)
+    INSERT INTO balances (account, date, balance)
+    SELECT legs.account, legs.date, COALESCE(
+        (SELECT balances.balance FROM balances
+            WHERE balances.account = legs.account AND balances.date < legs.date
+            ORDER BY balances.date DESC LIMIT 1),
+        (SELECT balances.balance - balances.delta FROM balances
+            WHERE balances.account = legs.account
+            ORDER BY balances.date ASC LIMIT 1),
+        (SELECT round(accounts.balance::DOUBLE PRECISION::NUMERIC, 2) FROM accounts WHERE accounts.id = legs.account))
+    FROM unnest(account_ids, days) AS legs (account, date)
+    ON CONFLICT (account, date) DO NOTHING;
+
+    -- Add each change to its own day and every day after it
+    UPDATE balances SET
+        balance = balances.balance + changes.total,
+        delta = balances.delta + changes.own
+    FROM (
+        SELECT balances.account, balances.date,
+            SUM(legs.delta) AS total,
+            COALESCE(SUM(legs.delta) FILTER (WHERE legs.date = balances.date), 0) AS own
+        FROM balances
+        JOIN unnest(account_ids, days, amounts) AS legs (account, date, delta)
+            ON legs.account = balances.account AND legs.date <= balances.date
+        GROUP BY balances.account, balances.date
+    ) AS changes
+    WHERE balances.account = changes.account AND balances.date = changes.date;
+$$ LANGUAGE SQL;
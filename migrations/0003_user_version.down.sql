@@ -0,0 +1 @@
+ALTER TABLE users DROP COLUMN version;
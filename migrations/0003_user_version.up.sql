@@ -0,0 +1,3 @@
+-- Count changes to each user's ledger so that anything derived from it can be
+-- cached until the next change
+ALTER TABLE users ADD COLUMN version BIGINT NOT NULL DEFAULT 0;
@@ -0,0 +1,2 @@
+DROP FUNCTION create_interest(BIGINT, DECIMAL, DATE, BIGINT, DATE, DATE);
+DROP FUNCTION create_transfer(BIGINT, DECIMAL, DATE, BIGINT, BIGINT);
@@ -0,0 +1,84 @@
+-- Transfer money between two of a user's accounts in a single statement.
+-- Returns the new transaction, or only an error if an account doesn't exist
+-- (or belongs to someone else).
+CREATE FUNCTION create_transfer(owner_id BIGINT, transfer_amount DECIMAL, transfer_date DATE, source_id BIGINT, target_id BIGINT)
+RETURNS TABLE (id BIGINT, type SMALLINT, amount DECIMAL, date DATE, source BIGINT, target BIGINT, error TEXT) AS $$
+DECLARE
+    owned BIGINT[];
+    new_id BIGINT;
+    new_date DATE := COALESCE(transfer_date, CURRENT_DATE);
+BEGIN
+    -- Lock both accounts, always in order of their identifiers so that two
+    -- transactions locking the same accounts can't deadlock
+    SELECT array_agg(locked.id) INTO owned FROM (
+        SELECT accounts.id FROM accounts
+        WHERE accounts.owner = owner_id AND accounts.id IN (source_id, target_id)
+        ORDER BY accounts.id FOR UPDATE
+    ) AS locked;
+
+    -- Verify that both accounts exist (and belong to the user)
+    IF NOT COALESCE(source_id = ANY(owned), FALSE) THEN
+        RETURN QUERY SELECT NULL::BIGINT, NULL::SMALLINT, NULL::DECIMAL, NULL::DATE, NULL::BIGINT, NULL::BIGINT, 'Source account does not exist'::TEXT;
+        RETURN;
+    END IF;
+
+    IF NOT COALESCE(target_id = ANY(owned), FALSE) THEN
+        RETURN QUERY SELECT NULL::BIGINT, NULL::SMALLINT, NULL::DECIMAL, NULL::DATE, NULL::BIGINT, NULL::BIGINT, 'Target account does not exist'::TEXT;
+        RETURN;
+    END IF;
+
+    -- Create the transaction and the transfer
+    INSERT INTO transactions (owner, type, amount, date)
+    VALUES (owner_id, 0, transfer_amount, new_date)
+    RETURNING transactions.id INTO new_id;
+
+    INSERT INTO transfers (id, source, target) VALUES (new_id, source_id, target_id);
+
+    -- Move the money, keeping a history of both balances
+    PERFORM record_balances(ARRAY[source_id, target_id], ARRAY[new_date, new_date], ARRAY[-transfer_amount, transfer_amount]);
+
+    UPDATE accounts SET balance = accounts.balance + CASE accounts.id WHEN source_id THEN -transfer_amount ELSE transfer_amount END
+    WHERE accounts.id IN (source_id, target_id);
+
+    -- Invalidate anything cached from the user's ledger
+    UPDATE users SET version = users.version + 1 WHERE users.id = owner_id;
+
+    RETURN QUERY SELECT new_id, 0::SMALLINT, transfer_amount, new_date, source_id, target_id, NULL::TEXT;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Record interest accrued by one of a user's accounts in a single statement.
+-- Returns the new transaction, or only an error if the account doesn't exist
+-- (or belongs to someone else).
+CREATE FUNCTION create_interest(owner_id BIGINT, interest_amount DECIMAL, interest_date DATE, account_id BIGINT, start_date DATE, end_date DATE)
+RETURNS TABLE (id BIGINT, type SMALLINT, amount DECIMAL, date DATE, account BIGINT, startdate DATE, enddate DATE, error TEXT) AS $$
+DECLARE
+    new_id BIGINT;
+    new_date DATE := COALESCE(interest_date, CURRENT_DATE);
+BEGIN
+    -- Lock the account, verifying that it exists (and belongs to the user)
+    PERFORM FROM accounts WHERE accounts.owner = owner_id AND accounts.id = account_id FOR UPDATE;
+
+    IF NOT FOUND THEN
+        RETURN QUERY SELECT NULL::BIGINT, NULL::SMALLINT, NULL::DECIMAL, NULL::DATE, NULL::BIGINT, NULL::DATE, NULL::DATE, 'Account does not exist'::TEXT;
+        RETURN;
+    END IF;
+
+    -- Create the transaction and the interest entry
+    INSERT INTO transactions (owner, type, amount, date)
+    VALUES (owner_id, 1, interest_amount, new_date)
+    RETURNING transactions.id INTO new_id;
+
+    INSERT INTO interest (id, account, startdate, enddate) VALUES (new_id, account_id, start_date, end_date);
+
+    -- Add the interest to the account, keeping a history of its balance
+    PERFORM record_balances(ARRAY[account_id], ARRAY[new_date], ARRAY[interest_amount]);
+
+    UPDATE accounts SET balance = accounts.balance + interest_amount WHERE accounts.id = account_id;
+
+    -- Invalidate anything cached from the user's ledger
+    UPDATE users SET version = users.version + 1 WHERE users.id = owner_id;
+
+    RETURN QUERY SELECT new_id, 1::SMALLINT, interest_amount, new_date, account_id, start_date, end_date, NULL::TEXT;
+END;
+$$ LANGUAGE plpgsql;
@@ -0,0 +1,134 @@
+DROP FUNCTION create_interest(BIGINT, BIGINT, DATE, BIGINT, DATE, DATE);
+DROP FUNCTION create_transfer(BIGINT, BIGINT, DATE, BIGINT, BIGINT);
+DROP FUNCTION record_balances(BIGINT[], DATE[], BIGINT[]);
+
+ALTER TABLE accounts ALTER COLUMN balance DROP DEFAULT;
+ALTER TABLE accounts ALTER COLUMN balance TYPE REAL USING balance / 100.0;
+ALTER TABLE accounts ALTER COLUMN balance SET DEFAULT 0;
+
+ALTER TABLE balances ALTER COLUMN delta DROP DEFAULT;
+ALTER TABLE balances
+    ALTER COLUMN delta TYPE DECIMAL USING delta / 100.0,
+    ALTER COLUMN balance TYPE DECIMAL USING balance / 100.0;
+ALTER TABLE balances ALTER COLUMN delta SET DEFAULT 0;
+
+ALTER TABLE transactions ALTER COLUMN amount TYPE DECIMAL USING amount / 100.0;
+
+-- Record changes in balance on the given days. Must be called before the
+-- changes are applied to accounts.balance.
+CREATE FUNCTION record_balances(account_ids BIGINT[], days DATE[], amounts DECIMAL[]) RETURNS VOID AS $$
+    -- Start a row for each day that doesn't have one yet, carrying the balance
+    -- forward from the day before (or from the account's REAL balance, as an
+    -- exact NUMERIC so that the whole COALESCE isn't narrowed to REAL)
+    INSERT INTO balances (account, date, balance)
+    SELECT legs.account, legs.date, COALESCE(
+        (SELECT balances.balance FROM balances
+            WHERE balances.account = legs.account AND balances.date < legs.date
+            ORDER BY balances.date DESC LIMIT 1),
+        (SELECT balances.balance - balances.delta FROM balances
+            WHERE balances.account = legs.account
+            ORDER BY balances.date ASC LIMIT 1),
+        (SELECT round(accounts.balance::DOUBLE PRECISION::NUMERIC, 2) FROM accounts WHERE accounts.id = legs.account))
+    FROM unnest(account_ids, days) AS legs (account, date)
+    ON CONFLICT (account, date) DO NOTHING;
+
+    -- Add each change to its own day and every day after it
+    UPDATE balances SET
+        balance = balances.balance + changes.total,
+        delta = balances.delta + changes.own
+    FROM (
+        SELECT balances.account, balances.date,
+            SUM(legs.delta) AS total,
+            COALESCE(SUM(legs.delta) FILTER (WHERE legs.date = balances.date), 0) AS own
+        FROM balances
+        JOIN unnest(account_ids, days, amounts) AS legs (account, date, delta)
+            ON legs.account = balances.account AND legs.date <= balances.date
+        GROUP BY balances.account, balances.date
+    ) AS changes
+    WHERE balances.account = changes.account AND balances.date = changes.date;
+$$ LANGUAGE SQL;
+
+-- Transfer money between two of a user's accounts in a single statement.
+-- Returns the new transaction, or only an error if an account doesn't exist
+-- (or belongs to someone else).
+CREATE FUNCTION create_transfer(owner_id BIGINT, transfer_amount DECIMAL, transfer_date DATE, source_id BIGINT, target_id BIGINT)
+RETURNS TABLE (id BIGINT, type SMALLINT, amount DECIMAL, date DATE, source BIGINT, target BIGINT, error TEXT) AS $$
+DECLARE
+    owned BIGINT[];
+    new_id BIGINT;
+    new_date DATE := COALESCE(transfer_date, CURRENT_DATE);
+BEGIN
+    -- Lock both accounts, always in order of their identifiers so that two
+    -- transactions locking the same accounts can't deadlock
+    SELECT array_agg(locked.id) INTO owned FROM (
+        SELECT accounts.id FROM accounts
+        WHERE accounts.owner = owner_id AND accounts.id IN (source_id, target_id)
+        ORDER BY accounts.id FOR UPDATE
+    ) AS locked;
+
+    -- Verify that both accounts exist (and belong to the user)
+    IF NOT COALESCE(source_id = ANY(owned), FALSE) THEN
+        RETURN QUERY SELECT NULL::BIGINT, NULL::SMALLINT, NULL::DECIMAL, NULL::DATE, NULL::BIGINT, NULL::BIGINT, 'Source account does not exist'::TEXT;
+        RETURN;
+    END IF;
+
+    IF NOT COALESCE(target_id = ANY(owned), FALSE) THEN
+        RETURN QUERY SELECT NULL::BIGINT, NULL::SMALLINT, NULL::DECIMAL, NULL::DATE, NULL::BIGINT, NULL::BIGINT, 'Target account does not exist'::TEXT;
+        RETURN;
+    END IF;
+
+    -- Create the transaction and the transfer
+    INSERT INTO transactions (owner, type, amount, date)
+    VALUES (owner_id, 0, transfer_amount, new_date)
+    RETURNING transactions.id INTO new_id;
+
+    INSERT INTO transfers (id, source, target) VALUES (new_id, source_id, target_id);
+
+    -- Move the money, keeping a history of both balances
+    PERFORM record_balances(ARRAY[source_id, target_id], ARRAY[new_date, new_date], ARRAY[-transfer_amount, transfer_amount]);
+
+    UPDATE accounts SET balance = accounts.balance + CASE accounts.id WHEN source_id THEN -transfer_amount ELSE transfer_amount END
+    WHERE accounts.id IN (source_id, target_id);
+
+    -- Invalidate anything cached from the user's ledger
+    UPDATE users SET version = users.version + 1 WHERE users.id = owner_id;
+
+    RETURN QUERY SELECT new_id, 0::SMALLINT, transfer_amount, new_date, source_id, target_id, NULL::TEXT;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Record interest accrued by one of a user's accounts in a single statement.
+-- Returns the new transaction, or only an error if the account doesn't exist
+-- (or belongs to someone else).
+CREATE FUNCTION create_interest(owner_id BIGINT, interest_amount DECIMAL, interest_date DATE, account_id BIGINT, start_date DATE, end_date DATE)
+RETURNS TABLE (id BIGINT, type SMALLINT, amount DECIMAL, date DATE, account BIGINT, startdate DATE, enddate DATE, error TEXT) AS $$
+DECLARE
+    new_id BIGINT;
+    new_date DATE := COALESCE(interest_date, CURRENT_DATE);
+BEGIN
+    -- Lock the account, verifying that it exists (and belongs to the user)
+    PERFORM FROM accounts WHERE accounts.owner = owner_id AND accounts.id = account_id FOR UPDATE;
+
+    IF NOT FOUND THEN
+        RETURN QUERY SELECT NULL::BIGINT, NULL::SMALLINT, NULL::DECIMAL, NULL::DATE, NULL::BIGINT, NULL::DATE, NULL::DATE, 'Account does not exist'::TEXT;
+        RETURN;
+    END IF;
+
+    -- Create the transaction and the interest entry
+    INSERT INTO transactions (owner, type, amount, date)
+    VALUES (owner_id, 1, interest_amount, new_date)
+    RETURNING transactions.id INTO new_id;
+
+    INSERT INTO interest (id, account, startdate, enddate) VALUES (new_id, account_id, start_date, end_date);
+
+    -- Add the interest to the account, keeping a history of its balance
+    PERFORM record_balances(ARRAY[account_id], ARRAY[new_date], ARRAY[interest_amount]);
+
+    UPDATE accounts SET balance = accounts.balance + interest_amount WHERE accounts.id = account_id;
+
+    -- Invalidate anything cached from the user's ledger
+    UPDATE users SET version = users.version + 1 WHERE users.id = owner_id;
+
+    RETURN QUERY SELECT new_id, 1::SMALLINT, interest_amount, new_date, account_id, start_date, end_date, NULL::TEXT;
+END;
+$$ LANGUAGE plpgsql;
@@ -0,0 +1,170 @@
+-- Keep money as a whole number of cents, so that it always adds up exactly
+
+-- Refuse to round away fractions of a cent in the ledger. Fix the transactions
+-- listed and run the migration again. (Account balances kept as REAL can't
+-- hold cents exactly to begin with, so they are rounded.)
+DO $$
+DECLARE
+    invalid TEXT;
+BEGIN
+    SELECT string_agg(id::TEXT, ', ' ORDER BY id) INTO invalid
+    FROM transactions WHERE amount <> round(amount, 2);
+
+    IF invalid IS NOT NULL THEN
+        RAISE EXCEPTION 'Transactions with fractions of a cent: %', invalid;
+    END IF;
+
+    SELECT string_agg(DISTINCT account::TEXT, ', ') INTO invalid
+    FROM balances WHERE delta <> round(delta, 2);
+
+    IF invalid IS NOT NULL THEN
+        RAISE EXCEPTION 'Balance history with fractions of a cent for accounts: %', invalid;
+    END IF;
+END $$;
+
+DROP FUNCTION create_interest(BIGINT, DECIMAL, DATE, BIGINT, DATE, DATE);
+DROP FUNCTION create_transfer(BIGINT, DECIMAL, DATE, BIGINT, BIGINT);
+DROP FUNCTION record_balances(BIGINT[], DATE[], DECIMAL[]);
+
+ALTER TABLE transactions ALTER COLUMN amount TYPE BIGINT USING round(amount * 100);
+
+ALTER TABLE balances ALTER COLUMN delta DROP DEFAULT;
+ALTER TABLE balances
+    ALTER COLUMN delta TYPE BIGINT USING round(delta * 100),
+    ALTER COLUMN balance TYPE BIGINT USING round(balance * 100);
+ALTER TABLE balances ALTER COLUMN delta SET DEFAULT 0;
+
+ALTER TABLE accounts ALTER COLUMN balance DROP DEFAULT;
+ALTER TABLE accounts ALTER COLUMN balance TYPE BIGINT USING round(balance::DOUBLE PRECISION * 100);
+ALTER TABLE accounts ALTER COLUMN balance SET DEFAULT 0;
+
+-- Earlier versions of 0002 anchored the balance history on accounts.balance
+-- cast from REAL to DECIMAL, which keeps only 6 significant digits (so
+-- $12,345.67 became 12345.7). Shift each account's history so that it ends at
+-- the balance just converted from REAL through DOUBLE PRECISION, keeping the
+-- exact daily deltas.
+UPDATE balances SET balance = balances.balance + accounts.balance - latest.balance
+FROM accounts, (
+    SELECT DISTINCT ON (balances.account) balances.account, balances.balance
+    FROM balances ORDER BY balances.account, balances.date DESC
+) AS latest
+WHERE balances.account = latest.account AND accounts.id = latest.account
+AND accounts.balance <> latest.balance;
+
+-- Record changes in balance on the given days. Must be called before the
+-- changes are applied to accounts.balance.
+CREATE FUNCTION record_balances(account_ids BIGINT[], days DATE[], amounts BIGINT[]) RETURNS VOID AS $$
+    -- Start a row for each day that doesn't have one yet, carrying the balance
+    -- forward from the day before
+    INSERT INTO balances (account, date, balance)
+    SELECT legs.account, legs.date, COALESCE(
+        (SELECT balances.balance FROM balances
+            WHERE balances.account = legs.account AND balances.date < legs.date
+            ORDER BY balances.date DESC LIMIT 1),
+        (SELECT balances.balance - balances.delta FROM balances
+            WHERE balances.account = legs.account
+            ORDER BY balances.date ASC LIMIT 1),
+        (SELECT accounts.balance FROM accounts WHERE accounts.id = legs.account))
+    FROM unnest(account_ids, days) AS legs (account, date)
+    ON CONFLICT (account, date) DO NOTHING;
+
+    -- Add each change to its own day and every day after it
+    UPDATE balances SET
+        balance = balances.balance + changes.total,
+        delta = balances.delta + changes.own
+    FROM (
+        SELECT balances.account, balances.date,
+            SUM(legs.delta)::BIGINT AS total,
+            COALESCE(SUM(legs.delta) FILTER (WHERE legs.date = balances.date), 0)::BIGINT AS own
+        FROM balances
+        JOIN unnest(account_ids, days, amounts) AS legs (account, date, delta)
+            ON legs.account = balances.account AND legs.date <= balances.date
+        GROUP BY balances.account, balances.date
+    ) AS changes
+    WHERE balances.account = changes.account AND balances.date = changes.date;
+$$ LANGUAGE SQL;
+
+-- Transfer money between two of a user's accounts in a single statement.
+-- Returns the new transaction, or only an error if an account doesn't exist
+-- (or belongs to someone else).
+CREATE FUNCTION create_transfer(owner_id BIGINT, transfer_amount BIGINT, transfer_date DATE, source_id BIGINT, target_id BIGINT)
+RETURNS TABLE (id BIGINT, type SMALLINT, amount BIGINT, date DATE, source BIGINT, target BIGINT, error TEXT) AS $$
+DECLARE
+    owned BIGINT[];
+    new_id BIGINT;
+    new_date DATE := COALESCE(transfer_date, CURRENT_DATE);
+BEGIN
+    -- Lock both accounts, always in order of their identifiers so that two
+    -- transactions locking the same accounts can't deadlock
+    SELECT array_agg(locked.id) INTO owned FROM (
+        SELECT accounts.id FROM accounts
+        WHERE accounts.owner = owner_id AND accounts.id IN (source_id, target_id)
+        ORDER BY accounts.id FOR UPDATE
+    ) AS locked;
+
+    -- Verify that both accounts exist (and belong to the user)
+    IF NOT COALESCE(source_id = ANY(owned), FALSE) THEN
+        RETURN QUERY SELECT NULL::BIGINT, NULL::SMALLINT, NULL::BIGINT, NULL::DATE, NULL::BIGINT, NULL::BIGINT, 'Source account does not exist'::TEXT;
+        RETURN;
+    END IF;
+
+    IF NOT COALESCE(target_id = ANY(owned), FALSE) THEN
+        RETURN QUERY SELECT NULL::BIGINT, NULL::SMALLINT, NULL::BIGINT, NULL::DATE, NULL::BIGINT, NULL::BIGINT, 'Target account does not exist'::TEXT;
+        RETURN;
+    END IF;
+
+    -- Create the transaction and the transfer
+    INSERT INTO transactions (owner, type, amount, date)
+    VALUES (owner_id, 0, transfer_amount, new_date)
+    RETURNING transactions.id INTO new_id;
+
+    INSERT INTO transfers (id, source, target) VALUES (new_id, source_id, target_id);
+
+    -- Move the money, keeping a history of both balances
+    PERFORM record_balances(ARRAY[source_id, target_id], ARRAY[new_date, new_date], ARRAY[-transfer_amount, transfer_amount]);
+
+    UPDATE accounts SET balance = accounts.balance + CASE accounts.id WHEN source_id THEN -transfer_amount ELSE transfer_amount END
+    WHERE accounts.id IN (source_id, target_id);
+
+    -- Invalidate anything cached from the user's ledger
+    UPDATE users SET version = users.version + 1 WHERE users.id = owner_id;
+
+    RETURN QUERY SELECT new_id, 0::SMALLINT, transfer_amount, new_date, source_id, target_id, NULL::TEXT;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Record interest accrued by one of a user's accounts in a single statement.
+-- Returns the new transaction, or only an error if the account doesn't exist
+-- (or belongs to someone else).
+CREATE FUNCTION create_interest(owner_id BIGINT, interest_amount BIGINT, interest_date DATE, account_id BIGINT, start_date DATE, end_date DATE)
+RETURNS TABLE (id BIGINT, type SMALLINT, amount BIGINT, date DATE, account BIGINT, startdate DATE, enddate DATE, error TEXT) AS $$
+DECLARE
+    new_id BIGINT;
+    new_date DATE := COALESCE(interest_date, CURRENT_DATE);
+BEGIN
+    -- Lock the account, verifying that it exists (and belongs to the user)
+    PERFORM FROM accounts WHERE accounts.owner = owner_id AND accounts.id = account_id FOR UPDATE;
+
+    IF NOT FOUND THEN
+        RETURN QUERY SELECT NULL::BIGINT, NULL::SMALLINT, NULL::BIGINT, NULL::DATE, NULL::BIGINT, NULL::DATE, NULL::DATE, 'Account does not exist'::TEXT;
+        RETURN;
+    END IF;
+
+    -- Create the transaction and the interest entry
+    INSERT INTO transactions (owner, type, amount, date)
+    VALUES (owner_id, 1, interest_amount, new_date)
+    RETURNING transactions.id INTO new_id;
+
+    INSERT INTO interest (id, account, startdate, enddate) VALUES (new_id, account_id, start_date, end_date);
+
+    -- Add the interest to the account, keeping a history of its balance
+    PERFORM record_balances(ARRAY[account_id], ARRAY[new_date], ARRAY[interest_amount]);
+
+    UPDATE accounts SET balance = accounts.balance + interest_amount WHERE accounts.id = account_id;
+
+    -- Invalidate anything cached from the user's ledger
+    UPDATE users SET version = users.version + 1 WHERE users.id = owner_id;
+
+    RETURN QUERY SELECT new_id, 1::SMALLINT, interest_amount, new_date, account_id, start_date, end_date, NULL::TEXT;
+END;
+$$ LANGUAGE plpgsql;
@@ -20,9 +20,11 @@ setuptools.setup(
     ],
     python_requires='>=3.10',
     install_requires=[
-        'flask==2.0.2',
+        'flask==2.3.3',
         'gunicorn==20.1.0',
-        'psycopg==3.0.1',
-        'bcrypt==3.2.0'
+        'psycopg==3.1.18',
+        'psycopg-pool==3.2.1',
+        'bcrypt==3.2.0',
+        'prometheus-client==0.19.0'
     ]
 )
\ No newline at end of file